@@ -7,13 +7,360 @@ to improve performance and reduce network usage.
 """
 
 import os
+import json
+import sqlite3
+import functools
+import collections
 import shutil
 import hashlib
 import logging
+import mmap
 import time
 import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, Optional, Tuple, List
+from typing import Dict, Any, Iterator, Optional, Tuple, List
+
+from utils.loop_utils import read_partition_table
+
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
+# Read size used when hashing large image files
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+# Files from this size on are hashed through an mmap
+MMAP_MIN_SIZE = 10 * 1024 * 1024
+
+# Magic bytes at the start of every XZ file
+XZ_MAGIC = b'\xfd7zXZ\x00'
+
+# Suffix of the marker file recording a successful checksum validation
+VALIDATED_SUFFIX = ".ok"
+
+# Schema of the metadata database, one row per cache key
+METADATA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    json BLOB NOT NULL,
+    size INT,
+    mtime_ns INT,
+    last_access REAL
+)
+"""
+
+
+def _hash_file(path: Path, algorithm: str = "sha256") -> str:
+    """
+    Calculate the checksum of a file.
+    
+    Kept at module level so it can be dispatched to worker processes.
+    
+    Args:
+        path: Path to the file
+        algorithm: Checksum algorithm to use
+        
+    Returns:
+        str: Calculated checksum
+    """
+    return _hash_file_multi(path, (algorithm,))[algorithm]
+
+
+def _hash_file_multi(path: Path, algorithms: Tuple[str, ...] = ("sha256",)) -> Dict[str, str]:
+    """
+    Calculate several checksums of a file in a single read pass.
+    
+    Args:
+        path: Path to the file
+        algorithms: Checksum algorithms to compute
+        
+    Returns:
+        Dict[str, str]: Calculated checksum per algorithm
+    """
+    if tuple(algorithms) == ("blake3",):
+        _hash_constructor("blake3")
+        # Multithreaded SIMD hashing straight from a memory map
+        hasher = blake3(max_threads=blake3.AUTO)
+        hasher.update_mmap(path)
+        return {"blake3": hasher.hexdigest()}
+    
+    hash_ctors = [_hash_constructor(algorithm) for algorithm in algorithms]
+    
+    with open(path, "rb", buffering=0) as f:
+        fd = f.fileno()
+        # Ask for aggressive readahead, and drop the pages once hashed so
+        # the image does not evict the page cache of the following stages
+        _fadvise(fd, "POSIX_FADV_SEQUENTIAL")
+        try:
+            hashers = _digest_file(f, hash_ctors)
+        finally:
+            _fadvise(fd, "POSIX_FADV_DONTNEED")
+    
+    return {algorithm: hasher.hexdigest() for algorithm, hasher in zip(algorithms, hashers)}
+
+
+def _hash_constructor(algorithm: str):
+    """
+    Get the constructor of a checksum algorithm.
+    
+    Unknown algorithms fall back to sha256.
+    
+    Args:
+        algorithm: Checksum algorithm name
+        
+    Returns:
+        Callable creating a new hash object
+        
+    Raises:
+        ValueError: If blake3 is requested but not installed
+    """
+    if algorithm == "blake3":
+        if blake3 is None:
+            raise ValueError("Checksum type blake3 requires the 'blake3' package")
+        return lambda: blake3(max_threads=blake3.AUTO)
+    
+    return getattr(hashlib, algorithm, hashlib.sha256)
+
+
+def _digest_file(f, hash_ctors) -> list:
+    """
+    Feed an open binary file into new hash objects, reading it only once.
+    
+    Args:
+        f: Unbuffered binary file object positioned at the start
+        hash_ctors: Constructors of the algorithms to use
+        
+    Returns:
+        list: The updated hash objects, in constructor order
+    """
+    # Map large files and hand them to each hash in a single C call.
+    # Mapping fails for images larger than the address space (32-bit
+    # Pi hosts) and on some network filesystems; those fall back to
+    # streamed reads, as do small files where mapping does not pay off.
+    if os.fstat(f.fileno()).st_size >= MMAP_MIN_SIZE:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                hashers = [hash_ctor() for hash_ctor in hash_ctors]
+                if len(hashers) == 1:
+                    hashers[0].update(mm)
+                else:
+                    # hashlib releases the GIL, so the algorithms run on
+                    # separate cores over the same mapped pages
+                    with ThreadPoolExecutor(max_workers=len(hashers)) as executor:
+                        list(executor.map(lambda hasher: hasher.update(mm), hashers))
+                return hashers
+        except (OSError, ValueError, OverflowError):
+            pass
+    
+    # Python 3.11+ hashes in C with the GIL released
+    if len(hash_ctors) == 1 and hasattr(hashlib, "file_digest"):
+        return [hashlib.file_digest(f, hash_ctors[0])]
+    
+    # Read in 1 MiB chunks into a reusable buffer
+    hashers = [hash_ctor() for hash_ctor in hash_ctors]
+    buf = bytearray(CHECKSUM_CHUNK_SIZE)
+    view = memoryview(buf)
+    if len(hashers) == 1:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            hashers[0].update(view[:n])
+        return hashers
+    
+    # Several algorithms hash each chunk in parallel; the buffer is only
+    # refilled once all of them are done with it
+    with ThreadPoolExecutor(max_workers=len(hashers)) as executor:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            chunk = view[:n]
+            for future in [executor.submit(hasher.update, chunk) for hasher in hashers]:
+                future.result()
+    
+    return hashers
+
+
+def _fadvise(fd: int, advice: str) -> None:
+    """
+    Give the kernel an access pattern hint for a file, where supported.
+    
+    Args:
+        fd: Open file descriptor
+        advice: Name of the os.POSIX_FADV_* constant
+    """
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, 0, getattr(os, advice))
+        except OSError:
+            pass
+
+
+def _copy_file_data(src_fd: int, dst_fd: int, size: int) -> None:
+    """
+    Copy the contents of one open file to another inside the kernel.
+    
+    Uses copy_file_range (reflinks or server-side copies where the
+    filesystem supports it), then sendfile, and only falls back to
+    copying through userspace when neither is available.
+    
+    Args:
+        src_fd: File descriptor open for reading
+        dst_fd: File descriptor open for writing
+        size: Number of bytes to copy
+    """
+    remaining = size
+    for copy in ("copy_file_range", "sendfile"):
+        if not hasattr(os, copy):
+            continue
+        try:
+            while remaining > 0:
+                if copy == "copy_file_range":
+                    copied = os.copy_file_range(src_fd, dst_fd, remaining)
+                else:
+                    copied = os.sendfile(dst_fd, src_fd, None, remaining)
+                if not copied:
+                    # Nothing copied (e.g. across filesystems or from a
+                    # pseudo-fs), let the next method continue from here
+                    break
+                remaining -= copied
+        except OSError:
+            # Unsupported by this filesystem pair, continue where it stopped
+            pass
+        if remaining <= 0:
+            return
+    
+    with open(src_fd, "rb", closefd=False) as src, open(dst_fd, "wb", closefd=False) as dst:
+        shutil.copyfileobj(src, dst, CHECKSUM_CHUNK_SIZE)
+
+
+def _copy_metadata(src: str, dst: str, st: os.stat_result) -> None:
+    """
+    Copy ownership, permissions, timestamps and extended attributes.
+    
+    Args:
+        src: Source path
+        dst: Destination path, which may be a symlink
+        st: lstat result of the source
+    """
+    follow = not os.path.islink(dst)
+    try:
+        os.chown(dst, st.st_uid, st.st_gid, follow_symlinks=follow)
+    except OSError:
+        pass
+    
+    # File capabilities (e.g. on ping) live in xattrs on the rootfs
+    if hasattr(os, "listxattr"):
+        try:
+            names = os.listxattr(src, follow_symlinks=False)
+        except OSError:
+            names = []
+        for name in names:
+            # Skip only attributes this host refuses (security.selinux
+            # without SELinux, trusted.* without privileges)
+            try:
+                os.setxattr(dst, name, os.getxattr(src, name, follow_symlinks=False), follow_symlinks=False)
+            except OSError:
+                pass
+    
+    # Mode after chown, which clears setuid bits
+    if follow:
+        os.chmod(dst, st.st_mode & 0o7777)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=follow)
+
+
+def _copy_tree(src_root: str, dst_root: str) -> None:
+    """
+    Copy a directory tree like ``cp -a``, with in-kernel file copies.
+    
+    Preserves symlinks, hard links, device nodes, ownership, permissions,
+    timestamps and extended attributes.
+    
+    Args:
+        src_root: Directory to copy from
+        dst_root: Existing directory to copy into
+    """
+    # (st_dev, st_ino) -> destination of files with several hard links
+    links = {}
+    # Directory metadata is applied last so copying does not touch the mtimes
+    dirs = [(src_root, dst_root, os.lstat(src_root))]
+    stack = [(src_root, dst_root)]
+    while stack:
+        src_dir, dst_dir = stack.pop()
+        with os.scandir(src_dir) as it:
+            for entry in it:
+                src = entry.path
+                dst = os.path.join(dst_dir, entry.name)
+                st = entry.stat(follow_symlinks=False)
+                
+                if entry.is_dir(follow_symlinks=False):
+                    os.makedirs(dst, exist_ok=True)
+                    dirs.append((src, dst, st))
+                    stack.append((src, dst))
+                    continue
+                
+                if st.st_nlink > 1:
+                    linked = links.get((st.st_dev, st.st_ino))
+                    if linked is not None:
+                        os.link(linked, dst)
+                        continue
+                    links[(st.st_dev, st.st_ino)] = dst
+                
+                if entry.is_symlink():
+                    os.symlink(os.readlink(src), dst)
+                elif entry.is_file(follow_symlinks=False):
+                    with open(src, "rb", buffering=0) as fsrc, open(dst, "wb", buffering=0) as fdst:
+                        _copy_file_data(fsrc.fileno(), fdst.fileno(), st.st_size)
+                else:
+                    os.mknod(dst, st.st_mode, st.st_rdev)
+                _copy_metadata(src, dst, st)
+    
+    for src, dst, st in reversed(dirs):
+        _copy_metadata(src, dst, st)
+
+
+@functools.lru_cache(maxsize=256)
+def _cache_key(version: str, model: str, checksum: str) -> str:
+    """
+    Build the cache key for an image.
+    
+    Memoized because every cache lookup derives the key several times.
+    
+    Args:
+        version: Image version
+        model: Raspberry Pi model
+        checksum: Expected image checksum
+        
+    Returns:
+        str: Cache key for the image
+    """
+    # Create a unique but deterministic key (not security relevant)
+    key_parts = f"{version}_{model}_{checksum}"
+    return hashlib.blake2b(key_parts.encode(), digest_size=16).hexdigest()
+
+
+def _legacy_cache_key(version: str, model: str, checksum: str) -> str:
+    """
+    Build the MD5 cache key used by earlier releases.
+    
+    Only needed to find download directories created under the old keys.
+    
+    Args:
+        version: Image version
+        model: Raspberry Pi model
+        checksum: Expected image checksum
+        
+    Returns:
+        str: Legacy cache key for the image
+    """
+    key_parts = f"{version}_{model}_{checksum}"
+    return hashlib.md5(key_parts.encode()).hexdigest()
+
 
 class CacheManager:
     """
@@ -35,16 +382,44 @@ class CacheManager:
         self.base_dir = base_dir
         self.max_age_days = max_age_days
         self.max_size_gb = max_size_gb
+        self.max_size_bytes = max_size_gb * (1 << 30)
         self.logger = logging.getLogger("cache_manager")
         
         # Ensure cache directories exist
         self.downloads_dir = base_dir / "downloads"
         self.unpacked_dir = base_dir / "unpacked"
         self.metadata_dir = base_dir / "metadata"
+        self._downloads_str = os.fspath(self.downloads_dir)
+        self._unpacked_str = os.fspath(self.unpacked_dir)
         
         self.downloads_dir.mkdir(parents=True, exist_ok=True)
         self.unpacked_dir.mkdir(parents=True, exist_ok=True)
         self.metadata_dir.mkdir(parents=True, exist_ok=True)
+        
+        # All metadata lives in one database instead of a JSON file per key
+        self.metadata_db = base_dir / "metadata.db"
+        self._db = sqlite3.connect(os.fspath(self.metadata_db), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute(METADATA_SCHEMA)
+        
+        # Move downloads made under the old MD5 keys before anything looks them up
+        self._known_keys = set()
+        self._import_json_metadata()
+        for image_info in self._iter_metadata():
+            self._migrate_legacy_download(image_info)
+        
+        # Cache keys with a download directory, for syscall-free misses
+        self._known_keys.update(os.listdir(self._downloads_str))
+        
+        # Image checksums are only fast with the OpenSSL (SHA-NI/ARMv8 CE) backend
+        if hashlib.sha256.__module__ == "_hashlib":
+            self.logger.debug("Using OpenSSL sha256 backend for image checksums")
+        else:
+            self.logger.warning("hashlib is not backed by OpenSSL, image checksums will be slow")
+        if blake3 is None:
+            self.logger.debug("blake3 not installed, checksum_type blake3 is unavailable")
     
     def get_cache_key(self, image_info: Dict[str, Any]) -> str:
         """
@@ -56,14 +431,11 @@ class CacheManager:
         Returns:
             str: Cache key for the image
         """
-        # Create a hash from version and checksum
-        version = image_info.get("version", "unknown")
-        checksum = image_info.get("checksum", "")
-        model = image_info.get("model", "generic")
-        
-        # Create a unique but deterministic key
-        key_parts = f"{version}_{model}_{checksum}"
-        return hashlib.md5(key_parts.encode()).hexdigest()
+        return _cache_key(
+            image_info.get("version", "unknown"),
+            image_info.get("model", "generic"),
+            image_info.get("checksum", "")
+        )
     
     def get_download_path(self, image_info: Dict[str, Any]) -> Path:
         """
@@ -75,9 +447,21 @@ class CacheManager:
         Returns:
             Path: Path for the downloaded image
         """
+        return Path(self._download_path_str(image_info))
+    
+    def _download_path_str(self, image_info: Dict[str, Any]) -> str:
+        """
+        Build the download path as a plain string, avoiding Path allocations.
+        
+        Args:
+            image_info: Dictionary containing image information
+            
+        Returns:
+            str: Path for the downloaded image
+        """
         cache_key = self.get_cache_key(image_info)
         filename = os.path.basename(image_info.get("url", "image.img"))
-        return self.downloads_dir / cache_key / filename
+        return os.path.join(self._downloads_str, cache_key, filename)
     
     def get_unpacked_path(self, image_info: Dict[str, Any]) -> Path:
         """
@@ -90,8 +474,8 @@ class CacheManager:
             Path: Path to the unpacked image
         """
         # Unpacked image path does not have the compression extension
-        download_path = self.get_download_path(image_info)
-        return download_path.with_suffix("")  # Remove file extension
+        download_path = self._download_path_str(image_info)
+        return Path(os.path.splitext(download_path)[0])  # Remove file extension
     
     def is_cached(self, image_info: Dict[str, Any]) -> Tuple[bool, bool]:
         """
@@ -103,31 +487,49 @@ class CacheManager:
         Returns:
             Tuple[bool, bool]: (is_download_cached, is_unpacked_cached)
         """
+        # Nothing can be cached for a key that has no download directory
+        if self.get_cache_key(image_info) not in self._known_keys:
+            return False, False
+        
         download_path = self.get_download_path(image_info)
         unpacked_path = self.get_unpacked_path(image_info)
         
-        # Check if download file exists and is valid
-        download_cached = download_path.exists() and self._validate_download(download_path, image_info)
+        download_exists = download_path.exists()
+        unpacked_exists = unpacked_path.exists()
         
-        # Check if unpacked file exists and is valid
-        unpacked_cached = unpacked_path.exists() and self._validate_unpacked(unpacked_path)
+        if download_exists and unpacked_exists:
+            # Hash the download while probing the unpacked image; hashlib
+            # releases the GIL, so the two checks overlap completely
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                download_future = executor.submit(self._validate_download, download_path, image_info)
+                unpacked_future = executor.submit(self._validate_unpacked, unpacked_path)
+                download_cached = download_future.result()
+                unpacked_cached = unpacked_future.result()
+        else:
+            # Check if download file exists and is valid
+            download_cached = download_exists and self._validate_download(download_path, image_info)
+            
+            # Check if unpacked file exists and is valid
+            unpacked_cached = unpacked_exists and self._validate_unpacked(unpacked_path)
         
         # Log caching status
+        if download_cached or unpacked_cached:
+            self._record_access(self.get_cache_key(image_info))
         if download_cached:
             self.logger.info(f"Download cached: {download_path}")
         if unpacked_cached:
             self.logger.info(f"Unpacked cached: {unpacked_path}")
         
         # If the downloaded file exists but is invalid, clean it up
-        if download_path.exists() and not download_cached:
+        if download_exists and not download_cached:
             self.logger.warning(f"Found corrupt cached file: {download_path}, removing it")
             try:
-                download_path.unlink()
+                self._remove_download(download_path)
             except Exception as e:
                 self.logger.error(f"Failed to remove corrupt cache file: {str(e)}")
         
         # If the unpacked directory exists but is invalid, clean it up
-        if unpacked_path.exists() and not unpacked_cached:
+        if unpacked_exists and not unpacked_cached:
             self.logger.warning(f"Found corrupt cached unpacked file: {unpacked_path}, removing it")
             try:
                 unpacked_path.unlink()
@@ -163,7 +565,7 @@ class CacheManager:
                 with open(path, 'rb') as f:
                     header = f.read(6)
                     
-                if len(header) < 6 or header[0] != 0xFD or header[1:6] != b'7zXZ\x00':
+                if header != XZ_MAGIC:
                     self.logger.warning(f"Cached XZ file has invalid header: {path}")
                     return False
             except Exception as e:
@@ -175,13 +577,180 @@ class CacheManager:
         checksum_type = image_info.get("checksum_type", "sha256")
         
         if checksum:
+            # Skip the rehash if this exact file was already validated
+            st = path.stat()
+            if self._is_validated(path, st, checksum, checksum_type):
+                return True
+            
             calc_checksum = self._calculate_checksum(path, checksum_type)
             if calc_checksum != checksum:
                 self.logger.warning(f"Checksum mismatch for {path}: expected {checksum}, got {calc_checksum}")
                 return False
+            
+            self._mark_validated(path, st, checksum, checksum_type)
         
         return True
     
+    def _marker_path(self, path: Path) -> Path:
+        """
+        Get the path of the validation marker kept next to a download.
+        
+        Args:
+            path: Path to the downloaded file
+            
+        Returns:
+            Path: Path of the marker file
+        """
+        return path.with_name(path.name + VALIDATED_SUFFIX)
+    
+    def _is_validated(self, path: Path, st: os.stat_result, checksum: str, algorithm: str) -> bool:
+        """
+        Check whether a download was already validated in its current state.
+        
+        The marker records size, mtime_ns, algorithm and checksum of the
+        validated file, so any rewrite of the download invalidates it.
+        
+        Args:
+            path: Path to the downloaded file
+            st: Current stat result of the downloaded file
+            checksum: Expected checksum
+            algorithm: Checksum algorithm of the expected checksum
+            
+        Returns:
+            bool: True if the stored validation is still current
+        """
+        try:
+            recorded = self._marker_path(path).read_text().split("\n")
+        except OSError:
+            return False
+        
+        return recorded[:4] == [str(st.st_size), str(st.st_mtime_ns), algorithm, checksum]
+    
+    def _mark_validated(self, path: Path, st: os.stat_result, checksum: str, algorithm: str) -> None:
+        """
+        Record a successful checksum validation next to the download.
+        
+        Args:
+            path: Path to the validated file
+            st: Stat result of the file at validation time
+            checksum: Validated checksum
+            algorithm: Algorithm used to compute the checksum
+        """
+        try:
+            self._marker_path(path).write_text(f"{st.st_size}\n{st.st_mtime_ns}\n{algorithm}\n{checksum}\n")
+        except OSError as e:
+            self.logger.warning(f"Failed to record validation for {path}: {str(e)}")
+    
+    def record_validated(self, path: Path, checksum: str, algorithm: str) -> None:
+        """
+        Record that a download matches its checksum, e.g. after hashing it
+        while it was downloaded, so is_cached() does not hash it again.
+        
+        Args:
+            path: Path to the downloaded file
+            checksum: Checksum the file matched
+            algorithm: Algorithm used to compute the checksum
+        """
+        self._mark_validated(path, path.stat(), checksum, algorithm)
+    
+    def _remove_download(self, path: Path, prune_parent: bool = True) -> None:
+        """
+        Remove a downloaded file, its validation marker and, if it is now
+        empty, its cache key directory.
+        
+        Args:
+            path: Path to the downloaded file
+            prune_parent: Whether to remove the cache key directory right away;
+                callers removing many files prune each directory once afterwards
+        """
+        path.unlink(missing_ok=True)
+        self._marker_path(path).unlink(missing_ok=True)
+        
+        if prune_parent:
+            self._prune_dir(path.parent)
+    
+    def _prune_dir(self, directory: Path) -> None:
+        """
+        Remove a cache key directory if it is empty.
+        
+        Args:
+            directory: Directory to remove
+        """
+        # rmdir() refuses non-empty directories, no need to list them first
+        try:
+            directory.rmdir()
+        except OSError:
+            return
+        self._known_keys.discard(directory.name)
+    
+    def validate_all(self) -> Dict[str, bool]:
+        """
+        Validate the checksums of all cached downloads in parallel.
+        
+        Downloads with a current validation marker are not rehashed.
+        
+        Returns:
+            Dict[str, bool]: Validation result per cache key
+        """
+        results = {}
+        pending = []
+        
+        for image_info in self._iter_metadata():
+            if not image_info.get("checksum"):
+                continue
+            
+            download_path = self.get_download_path(image_info)
+            if not download_path.exists():
+                continue
+            
+            cache_key = self.get_cache_key(image_info)
+            st = download_path.stat()
+            if self._is_validated(download_path, st, image_info["checksum"], image_info.get("checksum_type", "sha256")):
+                results[cache_key] = True
+                continue
+            
+            pending.append((cache_key, image_info, download_path, st))
+        
+        if not pending:
+            return results
+        
+        self.logger.info(f"Validating {len(pending)} cached downloads")
+        with ProcessPoolExecutor(max_workers=min(len(pending), os.cpu_count() or 1)) as executor:
+            checksums = executor.map(
+                _hash_file,
+                [entry[2] for entry in pending],
+                [entry[1].get("checksum_type", "sha256") for entry in pending]
+            )
+            
+            for (cache_key, image_info, download_path, st), calc_checksum in zip(pending, checksums):
+                valid = calc_checksum == image_info["checksum"]
+                results[cache_key] = valid
+                if valid:
+                    self._mark_validated(download_path, st, calc_checksum, image_info.get("checksum_type", "sha256"))
+                else:
+                    self.logger.warning(f"Checksum mismatch for {download_path}: expected {image_info['checksum']}, got {calc_checksum}")
+        
+        return results
+    
+    def _validate_unpacked_batch(self, paths: List[Path]) -> List[bool]:
+        """
+        Validate several unpacked image files concurrently.
+        
+        The boot sector probes are tiny reads dominated by I/O latency, so
+        they are overlapped in a thread pool rather than issued one by one.
+        
+        Args:
+            paths: Paths to the unpacked files
+            
+        Returns:
+            List[bool]: Validation result per path, in input order
+        """
+        if not paths:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(32, len(paths))) as executor:
+            return list(executor.map(self._validate_unpacked, paths))
+    
     def _validate_unpacked(self, path: Path) -> bool:
         """
         Validate an unpacked image file.
@@ -231,14 +800,20 @@ class CacheManager:
         Returns:
             str: Calculated checksum
         """
-        hash_func = getattr(hashlib, algorithm, hashlib.sha256)()
+        return _hash_file(path, algorithm)
+    
+    def _calculate_checksums(self, path: Path, algorithms: Tuple[str, ...] = ("sha256",)) -> Dict[str, str]:
+        """
+        Calculate several checksums for a file with a single read pass.
         
-        with open(path, "rb") as f:
-            # Read in chunks to avoid loading large files into memory
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_func.update(chunk)
-                
-        return hash_func.hexdigest()
+        Args:
+            path: Path to the file
+            algorithms: Checksum algorithms to use
+            
+        Returns:
+            Dict[str, str]: Calculated checksum per algorithm
+        """
+        return _hash_file_multi(path, algorithms)
     
     def clean_cache(self) -> None:
         """
@@ -246,104 +821,218 @@ class CacheManager:
         """
         self.logger.info("Cleaning cache...")
         
+        # Walk the cache once and share the result between the cleanup steps
+        entries = self._scan_cache()
+        
         # Delete old entries
-        self._clean_old_entries()
+        entries = self._clean_old_entries(entries)
+        
+        # Remove downloads that no longer match their checksum
+        removed = set()
+        for cache_key, valid in self.validate_all().items():
+            if not valid:
+                metadata = self.get_metadata(cache_key)
+                download_path = self.get_download_path(metadata)
+                self.logger.warning(f"Removing corrupt cached download: {download_path}")
+                self._remove_download(download_path)
+                removed.add(download_path)
+        
+        # Remove extracted images without a valid boot sector
+        unpacked_paths = []
+        for image_info in self._iter_metadata():
+            unpacked_path = self.get_unpacked_path(image_info)
+            if unpacked_path not in removed and unpacked_path.exists():
+                unpacked_paths.append(unpacked_path)
+        for unpacked_path, valid in zip(unpacked_paths, self._validate_unpacked_batch(unpacked_paths)):
+            if not valid:
+                self.logger.warning(f"Removing corrupt cached unpacked file: {unpacked_path}")
+                self._remove_download(unpacked_path)
+                removed.add(unpacked_path)
+        
+        if removed:
+            entries = [entry for entry in entries if entry[0] not in removed]
         
         # Check total size and remove oldest entries if needed
-        self._enforce_size_limit()
+        self._enforce_size_limit(entries)
         
         self.logger.info("Cache cleaning completed")
     
-    def _clean_old_entries(self) -> None:
+    def _scan_cache(self) -> List[Tuple[Path, float, int, bool]]:
+        """
+        Walk the cache once and collect its evictable entries.
+        
+        Downloads are individual files, unpacked images are whole directories
+        whose size is the sum of all files below them.
+        
+        Returns:
+            List[Tuple[Path, float, int, bool]]: (path, mtime, size, is_dir) per entry
+        """
+        entries = []
+        
+        # Downloads
+        with os.scandir(self._downloads_str) as key_dirs:
+            for key_dir in key_dirs:
+                if not key_dir.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(key_dir.path) as files:
+                    for f in files:
+                        if f.is_file(follow_symlinks=False) and not f.name.endswith(VALIDATED_SUFFIX):
+                            st = f.stat(follow_symlinks=False)
+                            entries.append((Path(f.path), st.st_mtime, st.st_size, False))
+        
+        # Unpacked
+        unpacked_dirs = []
+        with os.scandir(self._unpacked_str) as unpacked:
+            for entry in unpacked:
+                if entry.is_dir(follow_symlinks=False):
+                    unpacked_dirs.append((entry.path, entry.stat(follow_symlinks=False).st_mtime))
+        
+        # Size the unpacked trees concurrently, stat() releases the GIL
+        if unpacked_dirs:
+            with ThreadPoolExecutor(max_workers=min(8, len(unpacked_dirs))) as executor:
+                sizes = executor.map(self._dir_size, [path for path, _ in unpacked_dirs])
+                for (path, mtime), size in zip(unpacked_dirs, sizes):
+                    entries.append((Path(path), mtime, size, True))
+        
+        return entries
+    
+    def _iter_files(self, root: str) -> Iterator[Tuple[str, os.stat_result]]:
+        """
+        Recursively yield all regular files below a directory.
+        
+        Uses the stat information cached on each DirEntry, so every file
+        costs a single readdir entry plus at most one lstat.
+        
+        Args:
+            root: Directory to walk
+            
+        Yields:
+            Tuple[str, os.stat_result]: (path, stat) per file
+        """
+        stack = [root]
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry.path, entry.stat(follow_symlinks=False)
+    
+    def _dir_size(self, root: str) -> int:
+        """
+        Sum the sizes of all files below a directory.
+        
+        Args:
+            root: Directory to measure
+            
+        Returns:
+            int: Total size in bytes
+        """
+        return sum(st.st_size for _, st in self._iter_files(root))
+    
+    def _clean_old_entries(self, entries: Optional[List[Tuple[Path, float, int, bool]]] = None) -> List[Tuple[Path, float, int, bool]]:
         """
         Delete cache entries older than max_age_days.
+        
+        Args:
+            entries: Result of _scan_cache, scanned if not given
+            
+        Returns:
+            List[Tuple[Path, float, int, bool]]: The entries that were kept
         """
-        now = time.time()
-        max_age_seconds = self.max_age_days * 24 * 60 * 60
+        if entries is None:
+            entries = self._scan_cache()
         
-        # Check downloads
-        for entry in self.downloads_dir.glob("*/*"):
-            if entry.is_file() and entry.stat().st_mtime < (now - max_age_seconds):
-                self.logger.info(f"Removing old download: {entry}")
-                entry.unlink()
-                
-                # Remove parent directory if empty
-                parent = entry.parent
-                if not any(parent.iterdir()):
-                    parent.rmdir()
-        
-        # Check unpacked
-        for entry in self.unpacked_dir.glob("*"):
-            if entry.is_dir() and entry.stat().st_mtime < (now - max_age_seconds):
+        cutoff = time.time() - self.max_age_days * 24 * 60 * 60
+        kept = []
+        
+        # Entries with metadata age by their last use, others by their mtime
+        known = {key: last_access for key, last_access in self._db.execute("SELECT key, last_access FROM meta")}
+        
+        # Old downloads grouped by cache key directory
+        old_downloads = collections.defaultdict(list)
+        
+        for entry, mtime, size, is_dir in entries:
+            cache_key = entry.name if is_dir else entry.parent.name
+            last_used = known.get(cache_key) or mtime
+            if last_used >= cutoff:
+                kept.append((entry, mtime, size, is_dir))
+                continue
+            
+            if is_dir:
                 self.logger.info(f"Removing old unpacked image: {entry}")
                 shutil.rmtree(entry, ignore_errors=True)
+            else:
+                old_downloads[entry.parent].append(entry)
+        
+        for parent, paths in old_downloads.items():
+            for path in paths:
+                self.logger.info(f"Removing old download: {path}")
+                self._remove_download(path, prune_parent=False)
+            self._prune_dir(parent)
+        
+        return kept
     
-    def _enforce_size_limit(self) -> None:
+    def _enforce_size_limit(self, entries: Optional[List[Tuple[Path, float, int, bool]]] = None) -> None:
         """
         Enforce the maximum cache size by removing oldest entries.
+        
+        Args:
+            entries: Result of _scan_cache, scanned if not given
         """
+        if entries is None:
+            entries = self._scan_cache()
+        
         # Get total size
-        total_size = self._get_cache_size()
-        max_size_bytes = self.max_size_gb * 1024 * 1024 * 1024
+        total_size = self._get_cache_size(entries)
+        max_size_bytes = self.max_size_bytes
         
         if total_size <= max_size_bytes:
             return
-            
-        # List entries by modification time
-        entries = []
-        
-        # Downloads
-        for entry in self.downloads_dir.glob("*/*"):
-            if entry.is_file():
-                entries.append((entry, entry.stat().st_mtime, entry.stat().st_size))
         
-        # Unpacked
-        for entry in self.unpacked_dir.glob("*"):
-            if entry.is_dir():
-                size = sum(f.stat().st_size for f in entry.glob("**/*") if f.is_file())
-                entries.append((entry, entry.stat().st_mtime, size))
+        # LRU-2 order: entries used only once go first, the rest by the time
+        # of their second most recent use, so a single pass over the cache
+        # does not push out images that are reused regularly
+        def eviction_order(entry):
+            path, mtime, _, is_dir = entry
+            cache_key = path.name if is_dir else path.parent.name
+            access_times = (self.get_metadata(cache_key) or {}).get("access_times") or [mtime]
+            return len(access_times) >= 2, access_times[0]
         
-        # Sort by modification time (oldest first)
-        entries.sort(key=lambda x: x[1])
+        entries = sorted(entries, key=eviction_order)
         
         # Remove entries until we're under the limit
-        for entry, mtime, size in entries:
+        parents = set()
+        for entry, mtime, size, is_dir in entries:
             if total_size <= max_size_bytes:
                 break
                 
             self.logger.info(f"Removing to enforce size limit: {entry}")
-            if entry.is_file():
-                entry.unlink()
-                
-                # Remove parent directory if empty
-                parent = entry.parent
-                if not any(parent.iterdir()):
-                    parent.rmdir()
+            if not is_dir:
+                self._remove_download(entry, prune_parent=False)
+                parents.add(entry.parent)
             else:
                 shutil.rmtree(entry, ignore_errors=True)
                 
             total_size -= size
+        
+        for parent in parents:
+            self._prune_dir(parent)
     
-    def _get_cache_size(self) -> int:
+    def _get_cache_size(self, entries: Optional[List[Tuple[Path, float, int, bool]]] = None) -> int:
         """
         Calculate the total size of the cache in bytes.
         
+        Args:
+            entries: Result of _scan_cache, scanned if not given
+            
         Returns:
             int: Cache size in bytes
         """
-        total_size = 0
-        
-        # Downloads
-        for entry in self.downloads_dir.glob("**/*"):
-            if entry.is_file():
-                total_size += entry.stat().st_size
-        
-        # Unpacked
-        for entry in self.unpacked_dir.glob("**/*"):
-            if entry.is_file():
-                total_size += entry.stat().st_size
+        if entries is None:
+            entries = self._scan_cache()
         
-        return total_size
+        return sum(size for _, _, size, _ in entries)
     
     def save_metadata(self, image_info: Dict[str, Any]) -> None:
         """
@@ -353,11 +1042,90 @@ class CacheManager:
             image_info: Dictionary containing image information
         """
         cache_key = self.get_cache_key(image_info)
-        metadata_path = self.metadata_dir / f"{cache_key}.json"
+        self._known_keys.add(cache_key)
         
-        import json
-        with open(metadata_path, "w") as f:
-            json.dump(image_info, f, indent=2)
+        if "access_times" not in image_info:
+            image_info = {**image_info, "access_times": [time.time()]}
+        
+        try:
+            st = os.stat(self._download_path_str(image_info))
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+        except OSError:
+            size = mtime_ns = None
+        
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta (key, json, size, mtime_ns, last_access) VALUES (?, ?, ?, ?, ?)",
+                (cache_key, json.dumps(image_info), size, mtime_ns, image_info["access_times"][-1])
+            )
+    
+    def _import_json_metadata(self) -> None:
+        """
+        Move metadata written as one JSON file per key into the database.
+        """
+        with os.scandir(self.metadata_dir) as it:
+            paths = [entry.path for entry in it if entry.name.endswith(".json") and entry.is_file()]
+        
+        for path in paths:
+            try:
+                with open(path, "r") as f:
+                    image_info = json.load(f)
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Skipping unreadable cache metadata {path}: {str(e)}")
+                continue
+            
+            # Legacy metadata belongs to downloads stored under the MD5 key
+            self._migrate_legacy_download(image_info)
+            if self.get_metadata(self.get_cache_key(image_info)) is None:
+                self.save_metadata(image_info)
+            os.unlink(path)
+    
+    def _migrate_legacy_download(self, image_info: Dict[str, Any]) -> None:
+        """
+        Rename a download directory from its legacy MD5 key to the current key.
+        
+        Args:
+            image_info: Dictionary containing image information
+        """
+        key_args = (
+            image_info.get("version", "unknown"),
+            image_info.get("model", "generic"),
+            image_info.get("checksum", "")
+        )
+        legacy_dir = os.path.join(self._downloads_str, _legacy_cache_key(*key_args))
+        current_dir = os.path.join(self._downloads_str, _cache_key(*key_args))
+        if not os.path.isdir(legacy_dir) or os.path.exists(current_dir):
+            return
+        
+        try:
+            os.rename(legacy_dir, current_dir)
+            self.logger.info(f"Moved cached download {legacy_dir} to {current_dir}")
+        except OSError as e:
+            self.logger.warning(f"Cannot move cached download {legacy_dir}: {str(e)}")
+    
+    def _record_access(self, cache_key: str) -> None:
+        """
+        Remember the last two access times of a cache entry for eviction.
+        
+        Args:
+            cache_key: Cache key of the accessed entry
+        """
+        metadata = self.get_metadata(cache_key)
+        if metadata is None:
+            return
+        
+        metadata["access_times"] = (metadata.get("access_times", []) + [time.time()])[-2:]
+        self.save_metadata(metadata)
+    
+    def _iter_metadata(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the metadata of every cached image.
+        
+        Yields:
+            Dict[str, Any]: Image metadata
+        """
+        for (data,) in self._db.execute("SELECT json FROM meta").fetchall():
+            yield json.loads(data)
     
     def get_metadata(self, cache_key: str) -> Optional[Dict[str, Any]]:
         """
@@ -369,14 +1137,11 @@ class CacheManager:
         Returns:
             Optional[Dict[str, Any]]: Image metadata if available
         """
-        metadata_path = self.metadata_dir / f"{cache_key}.json"
-        
-        if not metadata_path.exists():
+        row = self._db.execute("SELECT json FROM meta WHERE key = ?", (cache_key,)).fetchone()
+        if row is None:
             return None
-            
-        import json
-        with open(metadata_path, "r") as f:
-            return json.load(f)
+        
+        return json.loads(row[0])
     
     def unpack_image(self, image_info: Dict[str, Any], image_path: Path) -> Optional[Path]:
         """
@@ -405,65 +1170,31 @@ class CacheManager:
             boot_dir.mkdir(exist_ok=True)
             rootfs_dir.mkdir(exist_ok=True)
             
-            # Set up loop device
-            self.logger.info(f"Setting up loop device for: {image_path}")
-            loop_result = subprocess.run(
-                ['losetup', '-f', '--show', str(image_path)],
-                capture_output=True, text=True, check=True
-            )
-            loop_device = loop_result.stdout.strip()
+            # Locate the partitions from the MBR instead of setting up a loop
+            # device and waiting for the kernel to expose partition nodes
+            partitions = read_partition_table(image_path)
+            if len(partitions) < 2:
+                raise ValueError(f"Expected boot and root partitions in {image_path}, found {len(partitions)}")
+            
+            temp_mount = Path("/tmp/w4b_temp_mount")
+            temp_mount.mkdir(exist_ok=True)
             
             try:
-                # Ensure partitions are detected
-                subprocess.run(['partprobe', loop_device], check=True)
-                
-                # Wait a moment for partitions to be available
-                time.sleep(1)
-                
-                # Determine partition devices
-                boot_part = f"{loop_device}p1"
-                root_part = f"{loop_device}p2"
-                
-                # Check if partitions exist with this naming scheme
-                if not Path(boot_part).exists() or not Path(root_part).exists():
-                    # Try alternate naming (without 'p')
-                    boot_part = f"{loop_device}1"
-                    root_part = f"{loop_device}2"
-                    
-                    # If still not found, try kpartx
-                    if not Path(boot_part).exists() or not Path(root_part).exists():
-                        self.logger.info("Using kpartx to map partitions")
-                        subprocess.run(['kpartx', '-av', loop_device], check=True)
-                        loop_name = os.path.basename(loop_device)
-                        boot_part = f"/dev/mapper/{loop_name}p1"
-                        root_part = f"/dev/mapper/{loop_name}p2"
-                
-                # Mount and copy boot partition
-                self.logger.info(f"Copying boot partition from {boot_part} to {boot_dir}")
-                temp_mount = Path("/tmp/w4b_temp_mount")
-                temp_mount.mkdir(exist_ok=True)
-                
-                try:
-                    subprocess.run(['mount', boot_part, str(temp_mount)], check=True)
-                    subprocess.run(['cp', '-a', f"{temp_mount}/.", str(boot_dir)], check=True)
-                finally:
-                    subprocess.run(['umount', str(temp_mount)], check=False)
-                
-                # Mount and copy root partition
-                self.logger.info(f"Copying root partition from {root_part} to {rootfs_dir}")
-                try:
-                    subprocess.run(['mount', root_part, str(temp_mount)], check=True)
-                    subprocess.run(['cp', '-a', f"{temp_mount}/.", str(rootfs_dir)], check=True)
-                finally:
-                    subprocess.run(['umount', str(temp_mount)], check=False)
-                    
+                for (offset, size), target_dir, name in zip(partitions, (boot_dir, rootfs_dir), ("boot", "root")):
+                    # Mount the partition straight from the image file and copy it out
+                    self.logger.info(f"Copying {name} partition at offset {offset} to {target_dir}")
+                    try:
+                        subprocess.run([
+                            'mount', '-o', f"loop,ro,offset={offset},sizelimit={size}",
+                            str(image_path), str(temp_mount)
+                        ], check=True)
+                        _copy_tree(str(temp_mount), str(target_dir))
+                    finally:
+                        subprocess.run(['umount', str(temp_mount)], check=False)
+            finally:
                 # Clean up
                 if temp_mount.exists():
                     temp_mount.rmdir()
-                    
-            finally:
-                # Detach loop device
-                subprocess.run(['losetup', '-d', loop_device], check=False)
             
             self.logger.info(f"Successfully unpacked image to: {unpacked_path}")
             return unpacked_path
@@ -9,15 +9,179 @@ command-line arguments, and configuration files.
 
 import os
 import sys  # Add missing sys import
+import asyncio
+import copy
+import json
+import functools
 import logging
 import re
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Union
+from types import MappingProxyType
+from typing import Callable, Dict, Any, Mapping, Optional, List, Tuple, Union
 
 import yaml
 
+# Parse with the libyaml C bindings when PyYAML was built with them
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
 from utils.error_handling import ConfigError
 
+# The hive configuration manager lives at the repository root
+_REPO_ROOT = str(Path(__file__).resolve().parents[3])
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+try:
+    from hive_config_manager.core.manager import HiveManager
+except ImportError:
+    HiveManager = None
+
+@functools.lru_cache(maxsize=32)
+def _parse_yaml_file(path: str, mtime_ns: int, size: int) -> Any:
+    """
+    Parse a YAML file, reusing earlier results.
+    
+    The modification time and size are part of the cache key, so an edited
+    file is parsed again. Nothing is written to disk: configs hold secrets.
+    
+    Args:
+        path: Path to the YAML file
+        mtime_ns: Modification time of the file in nanoseconds
+        size: Size of the file in bytes
+        
+    Returns:
+        Any: Parsed document; callers must not modify it
+    """
+    # Binary mode lets libyaml decode the UTF-8 itself
+    with open(path, "rb") as f:
+        return yaml.load(f, Loader=YamlLoader)
+
+
+def _freeze(config: Any) -> Any:
+    """
+    Make a configuration template read-only.
+    
+    Dicts become MappingProxyType views and lists become tuples, so the
+    template can be shared by every loaded configuration.
+    
+    Args:
+        config: Configuration value to freeze
+        
+    Returns:
+        Any: Read-only equivalent of the value
+    """
+    if isinstance(config, dict):
+        return MappingProxyType({key: _freeze(value) for key, value in config.items()})
+    if isinstance(config, list):
+        return tuple(_freeze(item) for item in config)
+    return config
+
+
+def _copy_template(template: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Copy a frozen configuration template into mutable dicts.
+    
+    Only the mappings are copied; tuples and scalars are immutable and
+    shared with the template.
+    
+    Args:
+        template: Template created by _freeze
+        
+    Returns:
+        Dict[str, Any]: Mutable configuration
+    """
+    return {
+        key: _copy_template(value) if isinstance(value, MappingProxyType) else value
+        for key, value in template.items()
+    }
+
+
+@functools.lru_cache(maxsize=128)
+def _split_config_path(path: str) -> Tuple[str, ...]:
+    """
+    Split a dotted configuration path into its keys.
+    
+    Args:
+        path: Dotted path (e.g., "system.timezone")
+        
+    Returns:
+        Tuple[str, ...]: Keys along the path
+    """
+    return tuple(path.split("."))
+
+
+# Environment variable values read as booleans
+_BOOL_TRUE = frozenset(("true", "yes", "1", "on"))
+_BOOL_FALSE = frozenset(("false", "no", "0", "off"))
+
+
+def _coerce_env_value(value: str) -> Any:
+    """
+    Convert an environment variable value to a bool or int where it looks like one.
+    
+    Args:
+        value: Raw environment variable value
+        
+    Returns:
+        Any: True, False, an int, or the unchanged string
+    """
+    # No boolean word is longer than five characters, skip lower() for the rest
+    if len(value) <= 5:
+        lowered = value.lower()
+        if lowered in _BOOL_TRUE:
+            return True
+        if lowered in _BOOL_FALSE:
+            return False
+    digits = value[1:] if value.startswith("-") else value
+    if digits.isdecimal():
+        return int(value)
+    return value
+
+
+# Marker for a path that does not exist in a nested dict
+_MISSING = object()
+
+
+def _get_path(config: Dict[str, Any], path: Tuple[str, ...]) -> Any:
+    """
+    Look up a value at a path in a nested dict.
+    
+    Args:
+        config: Nested dict to search
+        path: Keys leading to the value
+        
+    Returns:
+        Any: The value, or _MISSING if any key along the path is absent
+    """
+    for key in path:
+        if not isinstance(config, dict) or key not in config:
+            return _MISSING
+        config = config[key]
+    return config
+
+
+def _make_setter(path: Tuple[str, ...]) -> Callable[[Dict[str, Any], Any], None]:
+    """
+    Build a function that stores a value at a fixed path in a nested dict.
+    
+    Args:
+        path: Keys leading to the value
+        
+    Returns:
+        Callable[[Dict[str, Any], Any], None]: Setter creating missing parents
+    """
+    *parents, leaf = path
+    
+    def set_value(config: Dict[str, Any], value: Any) -> None:
+        for key in parents:
+            config = config.setdefault(key, {})
+        config[leaf] = value
+    
+    return set_value
+
 
 class ConfigManager:
     """
@@ -35,14 +199,15 @@ class ConfigManager:
         logger (logging.Logger): Logger instance
     """
     
-    # Default configuration values
-    DEFAULT_CONFIG = {
+    # Default configuration values, read-only so loads can share the leaves
+    DEFAULT_CONFIG = _freeze({
         "base_image": {
             "version": "2023-12-05-raspios-bullseye-arm64-lite",
             "url_template": "https://downloads.raspberrypi.org/raspios_lite_arm64/images/raspios_lite_arm64-{version}/2023-12-05-raspios-bullseye-arm64-lite.img.xz",
             "checksum_type": "sha256",
             "checksum": None,  # Will be fetched dynamically
-            "model": "pi4"
+            "model": "pi4",
+            "expected_extracted_size": None  # Bytes, preallocated before extraction if set
         },
         "system": {
             "hostname_prefix": "hive",
@@ -58,7 +223,7 @@ class ConfigManager:
         "security": {
             "firewall": {
                 "enabled": True,
-                "allow_ports": [22, 51820, 9100]
+                "allow_ports": (22, 51820, 9100)
             },
             "vpn": {
                 "type": "wireguard",
@@ -82,28 +247,32 @@ class ConfigManager:
             }
         },
         "software": {
-            "packages": [
+            "packages": (
                 "postgresql-14",
                 "postgresql-14-timescaledb-2",
                 "wireguard",
                 "python3-pip",
                 "python3-venv",
                 "prometheus-node-exporter"
-            ],
-            "python_packages": [
+            ),
+            "python_packages": (
                 "asyncpg",
                 "prometheus-client",
                 "pyyaml"
-            ]
+            )
         },
         "output": {
             "directory": "/tmp",
             "naming_template": "{timestamp}_{hive_id}",
             "compress": True,
+            "compression": "xz",  # or "zstd"
             "upload": False,
             "upload_url": None
+        },
+        "checksums": {
+            "algorithms": ("sha256",)
         }
-    }
+    })
     
     # Environment variable mapping
     ENV_MAPPING = {
@@ -117,6 +286,35 @@ class ConfigManager:
         "W4B_VPN_SERVER": ["security", "vpn", "server"]
     }
     
+    # ENV_MAPPING compiled into one setter per variable
+    _ENV_SETTERS = tuple((env_var, _make_setter(tuple(path))) for env_var, path in ENV_MAPPING.items())
+    
+    # Hive configuration fields copied into the image generator configuration
+    HIVE_MAPPING = (
+        (("security", "ssh", "public_key"), ("system", "ssh", "public_key")),
+        (("security", "ssh", "private_key"), ("system", "ssh", "private_key")),
+        (("security", "wireguard", "private_key"), ("security", "vpn", "private_key")),
+        (("security", "wireguard", "public_key"), ("security", "vpn", "public_key")),
+        (("security", "wireguard", "endpoint"), ("security", "vpn", "server")),
+        (("security", "wireguard", "config"), ("security", "vpn", "config")),
+        (("security", "database", "password"), ("services", "database", "password")),
+        (("security", "database", "username"), ("services", "database", "username")),
+        (("metadata", "name"), ("hive_name",)),
+        (("metadata", "location", "timezone"), ("system", "timezone")),
+    )
+    
+    # HIVE_MAPPING compiled into one setter per field
+    _HIVE_SETTERS = tuple((source, _make_setter(target)) for source, target in HIVE_MAPPING)
+    
+    # Mapped hive configurations by hive ID, shared by all instances
+    _HIVE_CACHE: Dict[str, Dict[str, Any]] = {}
+    
+    # Valid hive IDs
+    _HIVE_ID_RE = re.compile(r'[A-Za-z0-9_-]+')
+    
+    # Environment variable references: ${VAR_NAME} or ${VAR_NAME:-default}
+    _ENV_VAR_RE = re.compile(r'\$\{([A-Za-z0-9_]+)(?::-([^}]*))?\}')
+    
     def __init__(
         self, 
         config_file: Optional[str] = None,
@@ -136,6 +334,7 @@ class ConfigManager:
         self.cli_args = cli_args or {}
         self.config = {}
         self.logger = logging.getLogger("config")
+        self._hive_manager = None
     
     async def load(self) -> Dict[str, Any]:
         """
@@ -151,7 +350,7 @@ class ConfigManager:
             Dict[str, Any]: The merged configuration
         """
         # Start with default configuration
-        self.config = self._deep_copy(self.DEFAULT_CONFIG)
+        self.config = _copy_template(self.DEFAULT_CONFIG)
         
         # If hive_id was provided to constructor, set it
         if self.hive_id:
@@ -162,16 +361,22 @@ class ConfigManager:
             file_config = await self._load_from_file(self.config_file)
             self._merge_config(self.config, file_config)
         
+        # Read the environment once for the whole load
+        env = os.environ.copy()
+        
         # Load from environment variables
-        env_config = self._load_from_env()
+        env_config = self._load_from_env(env)
         self._merge_config(self.config, env_config)
         
         # Load from command-line arguments
         cli_config = self._load_from_cli()
         self._merge_config(self.config, cli_config)
         
-        # Substitute environment variables in string values
-        self._substitute_env_vars(self.config)
+        # Substitute environment variables in string values. Most configs
+        # have no ${...} references; a single scan of the serialized config
+        # is much cheaper than walking it in Python to find that out.
+        if '${' in json.dumps(self.config, default=str, skipkeys=True):
+            self._substitute_env_vars(self.config, env)
         
         # If hive_id is specified, try to load hive-specific configuration
         if "hive_id" in self.config:
@@ -196,51 +401,41 @@ class ConfigManager:
             ConfigError: If the file cannot be read or parsed
         """
         try:
-            path = Path(file_path)
-            if not path.exists():
+            try:
+                st = os.stat(file_path)
+            except FileNotFoundError:
                 self.logger.warning(f"Configuration file not found: {file_path}")
                 return {}
-                
-            with open(path, "r") as f:
-                config = yaml.safe_load(f)
+            
+            config = _parse_yaml_file(os.fspath(file_path), st.st_mtime_ns, st.st_size)
                 
             if not isinstance(config, dict):
                 raise ConfigError(f"Invalid configuration format in {file_path}")
                 
-            return config
+            # The parsed document is shared, hand out a private copy
+            return copy.deepcopy(config)
             
         except Exception as e:
             raise ConfigError(f"Error loading configuration from {file_path}: {e}")
     
-    def _load_from_env(self) -> Dict[str, Any]:
+    def _load_from_env(self, env: Optional[Mapping[str, str]] = None) -> Dict[str, Any]:
         """
         Load configuration from environment variables.
         
+        Args:
+            env: Snapshot of the environment, os.environ if not given
+            
         Returns:
             Dict[str, Any]: Configuration from environment variables
         """
+        if env is None:
+            env = os.environ
         config = {}
         
-        for env_var, path in self.ENV_MAPPING.items():
-            value = os.environ.get(env_var)
+        for env_var, set_value in self._ENV_SETTERS:
+            value = env.get(env_var)
             if value is not None:
-                # Convert to appropriate type
-                if value.lower() in ("true", "yes", "1"):
-                    value = True
-                elif value.lower() in ("false", "no", "0"):
-                    value = False
-                elif value.isdigit():
-                    value = int(value)
-                    
-                # Set in nested config dict
-                current = config
-                for i, key in enumerate(path):
-                    if i == len(path) - 1:
-                        current[key] = value
-                    else:
-                        if key not in current:
-                            current[key] = {}
-                        current = current[key]
+                set_value(config, _coerce_env_value(value))
         
         return config
     
@@ -283,87 +478,46 @@ class ConfigManager:
         Returns:
             Dict[str, Any]: Hive-specific configuration
         """
+        cached = self._HIVE_CACHE.get(hive_id)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        
+        if HiveManager is None:
+            self.logger.warning("Hive configuration manager not found, using default configuration")
+            return {}
+        
         try:
-            # Try to import the hive configuration manager
-            sys.path.append(str(Path(__file__).parents[3]))
-            from hive_config_manager.core.manager import HiveManager
-            
-            # Get the hive configuration
-            manager = HiveManager()
-            hive_config = manager.get_hive(hive_id)
+            # Get the hive configuration without blocking the event loop
+            hive_config = await asyncio.to_thread(self._read_hive, hive_id)
             
             # Map the hive config to our image generator config structure
             result = {}
+            for source_path, set_value in self._HIVE_SETTERS:
+                value = _get_path(hive_config, source_path)
+                if value is not _MISSING:
+                    set_value(result, value)
             
-            # Map security configuration
-            if "security" in hive_config:
-                security = hive_config["security"]
-                
-                # SSH configuration
-                if "ssh" in security:
-                    ssh = security["ssh"]
-                    if "system" not in result:
-                        result["system"] = {}
-                    if "ssh" not in result["system"]:
-                        result["system"]["ssh"] = {}
-                    
-                    if "public_key" in ssh:
-                        result["system"]["ssh"]["public_key"] = ssh["public_key"]
-                    if "private_key" in ssh:
-                        result["system"]["ssh"]["private_key"] = ssh["private_key"]
-                
-                # WireGuard configuration
-                if "wireguard" in security:
-                    wg = security["wireguard"]
-                    if "security" not in result:
-                        result["security"] = {}
-                    if "vpn" not in result["security"]:
-                        result["security"]["vpn"] = {}
-                    
-                    if "private_key" in wg:
-                        result["security"]["vpn"]["private_key"] = wg["private_key"]
-                    if "public_key" in wg:
-                        result["security"]["vpn"]["public_key"] = wg["public_key"]
-                    if "endpoint" in wg:
-                        result["security"]["vpn"]["server"] = wg["endpoint"]
-                    if "config" in wg:
-                        result["security"]["vpn"]["config"] = wg["config"]
-                
-                # Database configuration
-                if "database" in security:
-                    db = security["database"]
-                    if "services" not in result:
-                        result["services"] = {}
-                    if "database" not in result["services"]:
-                        result["services"]["database"] = {}
-                    
-                    if "password" in db:
-                        result["services"]["database"]["password"] = db["password"]
-                    if "username" in db:
-                        result["services"]["database"]["username"] = db["username"]
-            
-            # Map hive metadata
-            if "metadata" in hive_config:
-                meta = hive_config["metadata"]
-                
-                if "name" in meta:
-                    result["hive_name"] = meta["name"]
-                
-                if "location" in meta:
-                    if "timezone" in meta["location"]:
-                        if "system" not in result:
-                            result["system"] = {}
-                        result["system"]["timezone"] = meta["location"]["timezone"]
-            
-            return result
+            self._HIVE_CACHE[hive_id] = result
+            return copy.deepcopy(result)
             
-        except ImportError:
-            self.logger.warning("Hive configuration manager not found, using default configuration")
-            return {}
         except Exception as e:
             self.logger.warning(f"Error loading hive configuration: {str(e)}")
             return {}
     
+    def _read_hive(self, hive_id: str) -> Dict[str, Any]:
+        """
+        Read a hive configuration through the hive configuration manager.
+        
+        Args:
+            hive_id: ID of the hive
+            
+        Returns:
+            Dict[str, Any]: Hive configuration as stored by the manager
+        """
+        if self._hive_manager is None:
+            self._hive_manager = HiveManager()
+        return self._hive_manager.get_hive(hive_id)
+    
     def _merge_config(self, target: Dict[str, Any], source: Dict[str, Any]) -> None:
         """
         Recursively merge source configuration into target.
@@ -372,53 +526,53 @@ class ConfigManager:
             target: Target configuration to merge into
             source: Source configuration to merge from
         """
-        for key, value in source.items():
-            if isinstance(value, dict) and key in target and isinstance(target[key], dict):
-                # Recursively merge dictionaries
-                self._merge_config(target[key], value)
-            else:
-                # Replace or add values
-                target[key] = value
+        # Walk nested dicts with an explicit stack instead of recursion
+        stack = [(target, source)]
+        while stack:
+            target, source = stack.pop()
+            
+            # Dictionaries present on both sides are merged key by key
+            nested = {
+                key for key, value in source.items()
+                if isinstance(value, dict) and isinstance(target.get(key), dict)
+            }
+            if not nested:
+                # Replace or add all values in one C-level update
+                target.update(source)
+                continue
+            
+            for key, value in source.items():
+                if key in nested:
+                    stack.append((target[key], value))
+                else:
+                    target[key] = value
     
-    def _substitute_env_vars(self, config: Dict[str, Any]) -> None:
+    def _substitute_env_vars(self, config: Dict[str, Any], env: Optional[Mapping[str, str]] = None) -> None:
         """
-        Recursively substitute environment variables in string values.
+        Substitute environment variables in string values of nested dicts.
         
         Environment variables should be in the format ${VAR_NAME} or ${VAR_NAME:-default}.
         
         Args:
             config: Configuration dictionary to process
+            env: Snapshot of the environment, os.environ if not given
         """
-        for key, value in config.items():
-            if isinstance(value, dict):
-                self._substitute_env_vars(value)
-            elif isinstance(value, str):
-                # Pattern: ${VAR_NAME} or ${VAR_NAME:-default}
-                pattern = r'\${([A-Za-z0-9_]+)(?::-([^}]*))?}'
-                
-                def replace_env_var(match):
-                    var_name = match.group(1)
-                    default = match.group(2)
-                    return os.environ.get(var_name, default if default is not None else '')
-                
-                config[key] = re.sub(pattern, replace_env_var, value)
-    
-    def _deep_copy(self, obj: Any) -> Any:
-        """
-        Create a deep copy of an object.
+        if env is None:
+            env = os.environ
         
-        Args:
-            obj: Object to copy
-            
-        Returns:
-            Any: Deep copy of the object
-        """
-        if isinstance(obj, dict):
-            return {k: self._deep_copy(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._deep_copy(item) for item in obj]
-        else:
-            return obj
+        def replace_env_var(match):
+            default = match.group(2)
+            return env.get(match.group(1), default if default is not None else '')
+        
+        # Walk nested dicts with an explicit stack, sharing one callback
+        stack = [config]
+        while stack:
+            current = stack.pop()
+            for key, value in current.items():
+                if isinstance(value, dict):
+                    stack.append(value)
+                elif isinstance(value, str) and '${' in value:
+                    current[key] = self._ENV_VAR_RE.sub(replace_env_var, value)
     
     def validate(self) -> bool:
         """
@@ -440,7 +594,7 @@ class ConfigManager:
             
             # Validate hive_id format
             hive_id = self.config["hive_id"]
-            if not re.match(r'^[a-zA-Z0-9_-]+$', hive_id):
+            if not self._HIVE_ID_RE.fullmatch(hive_id):
                 self.logger.error(f"Invalid hive ID format: {hive_id}")
                 return False
             
@@ -471,10 +625,11 @@ class ConfigManager:
         Returns:
             Any: The configuration value or default
         """
-        parts = path.split(".")
+        # Only the split is cached: the config dict is shared with the build
+        # pipeline and may change after load(), so values are always looked up
         current = self.config
         
-        for part in parts:
+        for part in _split_config_path(path):
             if isinstance(current, dict) and part in current:
                 current = current[part]
             else:
@@ -7,19 +7,286 @@ and compressing Raspberry Pi OS disk images.
 """
 
 import asyncio
+import contextlib
+import errno
+import functools
+import aiofiles
 import aiohttp
 import hashlib
+import json
 import logging
+import lzma
+import mmap
 import os
 import shutil
 import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple, Union
+from typing import Awaitable, Callable, Dict, Iterator, List, Any, Optional, Tuple, Union
 import datetime  # This imports the module, not the class
 from datetime import datetime  # Add this line to import the datetime class directly
 
 from utils.error_handling import DiskOperationError, NetworkError, retry
+from utils.loop_utils import attach_loop_device, read_partition_table, wait_for_device_nodes
+
+# Checksums published for built images (config: checksums.algorithms)
+DEFAULT_CHECKSUM_ALGORITHMS = ("sha256",)
+
+# Slice of the memory-mapped image handed to the hasher at a time
+CHECKSUM_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Default read size for streamed downloads (config: download.chunk_size),
+# and the socket buffer of the HTTP session that has to hold several of them
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_READ_BUFSIZE = 4 * 1024 * 1024
+
+# Parallel HTTP range requests per download (config: download.connections),
+# used for files from RANGED_DOWNLOAD_MIN_SIZE on
+DOWNLOAD_CONNECTIONS = 8
+RANGED_DOWNLOAD_MIN_SIZE = 64 * 1024 * 1024
+
+# Compressed images below this size are decompressed in-process with lzma,
+# where starting xz costs more than its faster decoder saves
+LZMA_IN_PROCESS_MAX_SIZE = 64 * 1024 * 1024
+
+# Suffix of the marker written next to a completely extracted image
+EXTRACTED_SUFFIX = ".ok"
+
+# Suffix of the sidecar recording a file's last successful checksum check,
+# appended after the checksum type (e.g. image.img.xz.sha256.verified)
+VERIFIED_SUFFIX = ".verified"
+
+
+class _RangeNotSupported(Exception):
+    """Raised when a server answers a range request with the full body."""
+
+
+@contextlib.contextmanager
+def _sequential_read(file_path: Path, drop_cache: bool = True) -> Iterator[int]:
+    """
+    Open a file for one sequential pass that should not stay in the page cache.
+    
+    The kernel is told to read ahead aggressively, and the cached pages are
+    dropped when the block exits so gigabytes of image data do not evict
+    more useful pages.
+    
+    Args:
+        file_path: File to read
+        drop_cache: Whether to drop the file's cached pages on exit
+        
+    Yields:
+        int: Read-only file descriptor
+    """
+    fd = os.open(file_path, os.O_RDONLY)
+    advise = getattr(os, "posix_fadvise", None)
+    try:
+        if advise is not None:
+            advise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        yield fd
+    finally:
+        if advise is not None and drop_cache:
+            advise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        os.close(fd)
+
+
+def _hash_fd_into(fd: int, hash_obj: Any) -> None:
+    """
+    Feed the contents of an open file into a hash object.
+    
+    The file is memory-mapped so kernel readahead fills the pages and the
+    hasher gets large slices without a read call per chunk. Files that
+    cannot be mapped (larger than the address space on 32-bit Pi hosts,
+    some network filesystems) are read from the start of the descriptor.
+    
+    Args:
+        fd: File descriptor of the file to hash, not shared with other readers
+        hash_obj: Hash object to update
+    """
+    size = os.fstat(fd).st_size
+    if not size:
+        return  # Empty files cannot be mapped
+    try:
+        mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, OverflowError):
+        mm = None
+    if mm is not None:
+        with mm:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mm) as view:
+                for offset in range(0, size, CHECKSUM_CHUNK_SIZE):
+                    hash_obj.update(view[offset:offset + CHECKSUM_CHUNK_SIZE])
+        return
+    
+    os.lseek(fd, 0, os.SEEK_SET)
+    with open(fd, "rb", buffering=0, closefd=False) as f:
+        # Python 3.11+ runs the read loop for us; it only ever calls the
+        # constructor once, so the existing hash object is updated in place
+        if hasattr(hashlib, "file_digest"):
+            hashlib.file_digest(f, lambda: hash_obj)
+            return
+        
+        # Read in chunks into a reusable buffer
+        buf = bytearray(CHECKSUM_CHUNK_SIZE)
+        view = memoryview(buf)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            hash_obj.update(view[:n])
+
+
+def _hash_file_into(file_path: Path, hash_obj: Any, drop_cache: bool = True) -> None:
+    """
+    Feed the contents of a file into a hash object.
+    
+    Args:
+        file_path: File to hash
+        hash_obj: Hash object to update
+        drop_cache: Whether to drop the file's cached pages afterwards
+    """
+    with _sequential_read(file_path, drop_cache) as fd:
+        _hash_fd_into(fd, hash_obj)
+
+
+def _preallocate(fd: int, size: int) -> None:
+    """
+    Reserve disk space for a file before it is written.
+    
+    Lets the filesystem lay the file out in a few large extents instead of
+    growing it chunk by chunk. Filesystems without support are skipped.
+    
+    Args:
+        fd: File descriptor of the file
+        size: Number of bytes to reserve
+    """
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            pass
+
+
+def _lzma_decompress(source_path: Path, target_path: Path) -> None:
+    """
+    Decompress an xz file in-process.
+    
+    Args:
+        source_path: Compressed file
+        target_path: File to write the decompressed data to
+    """
+    with _sequential_read(source_path) as src_fd, \
+            lzma.open(open(src_fd, "rb", closefd=False)) as src, open(target_path, "wb") as dst:
+        buf = bytearray(CHECKSUM_CHUNK_SIZE)
+        view = memoryview(buf)
+        while True:
+            n = src.readinto(buf)
+            if not n:
+                break
+            dst.write(view[:n])
+
+
+def _data_extents(fd: int, size: int) -> Iterator[Tuple[int, int]]:
+    """
+    Find the regions of a file that hold data, skipping its holes.
+    
+    Filesystems that do not track holes report the whole file as data.
+    
+    Args:
+        fd: File descriptor of the file
+        size: Size of the file in bytes
+        
+    Yields:
+        Tuple[int, int]: Start and end offset of each data region
+    """
+    if not hasattr(os, "SEEK_DATA"):
+        yield 0, size
+        return
+    
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return  # Only a hole remains
+            raise
+        end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+        yield start, end
+        offset = end
+
+
+def _copy_range(src_fd: int, dst_fd: int, offset: int, count: int) -> None:
+    """
+    Copy a byte range to the same offset of another file inside the kernel.
+    
+    Uses copy_file_range, which can share blocks on Btrfs/XFS, and sendfile
+    where it is unavailable (older kernels, across filesystems).
+    
+    Args:
+        src_fd: File descriptor to copy from
+        dst_fd: File descriptor to copy to
+        offset: Start of the range
+        count: Number of bytes to copy
+    """
+    end = offset + count
+    use_copy_range = hasattr(os, "copy_file_range")
+    while offset < end:
+        if use_copy_range:
+            try:
+                n = os.copy_file_range(src_fd, dst_fd, end - offset, offset, offset)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+                use_copy_range = False
+                continue
+        else:
+            os.lseek(dst_fd, offset, os.SEEK_SET)
+            n = os.sendfile(dst_fd, src_fd, offset, end - offset)
+        if not n:
+            break  # Source shrank while copying
+        offset += n
+
+
+def _copy_file(source_path: Path, target_path: Path) -> None:
+    """
+    Copy a file inside the kernel, keeping it sparse.
+    
+    Only the data regions are copied; the holes of a mostly empty image
+    stay holes in the copy. Falls back to shutil.copyfile where the
+    required system calls are not supported.
+    
+    Args:
+        source_path: File to copy
+        target_path: Destination file
+    """
+    try:
+        with _sequential_read(source_path) as src_fd, open(target_path, "wb") as dst:
+            dst_fd = dst.fileno()
+            size = os.fstat(src_fd).st_size
+            os.ftruncate(dst_fd, size)
+            for start, end in _data_extents(src_fd, size):
+                _copy_range(src_fd, dst_fd, start, end - start)
+    except (AttributeError, OSError):
+        shutil.copyfile(source_path, target_path)
+
+
+@functools.lru_cache(maxsize=None)
+def _xz_decompress_command() -> Tuple[str, ...]:
+    """
+    Get the command that decompresses an xz stream from stdin to stdout.
+    
+    pixz decompresses any multi-block xz file in parallel; xz (5.4+) only
+    does so with --threads. Single-block images, which includes the official
+    Raspberry Pi OS releases, decompress on one core either way.
+    
+    Returns:
+        Tuple[str, ...]: Command and arguments
+    """
+    if shutil.which("pixz"):
+        return ("pixz", "-d")
+    return ("xz", "--decompress", "--threads=0", "--stdout")
 
 
 class ImageBuilder:
@@ -55,6 +322,13 @@ class ImageBuilder:
         self.boot_mount = None
         self.root_mount = None
         self.loop_device = None
+        # HTTP session shared by all downloads, created on first use
+        self._session = None
+        # External tools resolved once instead of on every call
+        self._tools = {
+            name: shutil.which(name) or name
+            for name in ("losetup", "mount", "umount", "sync", "xz", "pixz", "zstd")
+        }
 
         self.cache_dir = work_dir / "cache"
         self.extracted_cache_dir = self.cache_dir / "extracted"
@@ -65,6 +339,52 @@ class ImageBuilder:
         self.extracted_cache_dir.mkdir(parents=True, exist_ok=True)
         self.downloads_cache_dir.mkdir(parents=True, exist_ok=True)
     
+    async def _run(self, *cmd: str, stdin: Any = None,
+                   stdout: Any = asyncio.subprocess.PIPE) -> Tuple[int, Optional[bytes], bytes]:
+        """
+        Run an external command and wait for it to finish.
+        
+        Args:
+            *cmd: Command and arguments; the command is looked up in the
+                tools resolved at startup
+            stdin: Standard input of the command
+            stdout: Standard output of the command, captured by default;
+                pass DEVNULL when the output is not needed
+            
+        Returns:
+            Tuple[int, Optional[bytes], bytes]: Return code, captured output
+            (None if stdout is redirected) and error output
+        """
+        process = await asyncio.create_subprocess_exec(
+            self._tools.get(cmd[0], cmd[0]), *cmd[1:],
+            stdin=stdin,
+            stdout=stdout,
+            stderr=asyncio.subprocess.PIPE
+        )
+        output, stderr = await process.communicate()
+        return process.returncode, output, stderr
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Get the HTTP session shared by all downloads of this builder.
+        
+        Keeping one session reuses connections, TLS state and DNS lookups
+        across downloads.
+        
+        Returns:
+            aiohttp.ClientSession: Shared client session
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=16, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, read_bufsize=DOWNLOAD_READ_BUFSIZE)
+        return self._session
+    
+    async def close(self) -> None:
+        """Close the shared HTTP session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+    
     def generate_cache_path(self, version: str) -> Path:
         """
         Generate cache path for a given image version.
@@ -116,8 +436,10 @@ class ImageBuilder:
         download_path = self.downloads_cache_dir / filename
         
         # Check if we have a cached download
+        needs_download = True
         if download_path.exists():
             self.logger.info(f"Found cached download: {download_path}")
+            needs_download = False
             
             # Verify checksum if provided
             if checksum:
@@ -125,61 +447,207 @@ class ImageBuilder:
                     self.logger.info("Checksum verification passed for cached download")
                 else:
                     self.logger.warning("Checksum verification failed for cached download, re-downloading")
-                    await self.download_image(url, download_path)
+                    needs_download = True
         else:
-            # Download the image
             self.logger.info(f"Downloading image from {url}")
-            await self.download_image(url, download_path)
-            
-            # Verify checksum if provided
-            if checksum and not await self._verify_checksum(download_path, checksum, checksum_type):
-                raise ValueError(f"Checksum verification failed for downloaded image")
         
-        # Check if we need to extract the image
-        if filename.endswith(".xz"):
-            # Check if we have a cached extracted version
-            extracted_filename = filename[:-3]  # Remove .xz extension
-            extracted_path = self.extracted_cache_dir / extracted_filename
-            
-            if extracted_path.exists():
+        # If it's not compressed, just return the downloaded path
+        if not filename.endswith(".xz"):
+            if needs_download:
+                await self._download_verified(url, download_path, checksum, checksum_type)
+            return download_path
+        
+        # Key the extracted image on the verified content, so a new
+        # upload under the same name is never served from a stale cache
+        if checksum:
+            extracted_path, source_key = self._extracted_cache_entry(checksum, checksum_type)
+        else:
+            source_key = None
+            extracted_path = self.extracted_cache_dir / filename[:-3]  # Remove .xz extension
+        marker_path = extracted_path.with_name(extracted_path.name + EXTRACTED_SUFFIX)
+        
+        if needs_download:
+            # Decompress the image while it is downloading
+            marker_path.unlink(missing_ok=True)
+            await self._download_verified(url, download_path, checksum, checksum_type, extract_to=extracted_path)
+        else:
+            if source_key is None:
+                st = download_path.stat()
+                source_key = f"{st.st_size}:{st.st_mtime_ns}"
+            if self._is_extracted(extracted_path, source_key):
                 self.logger.info(f"Found cached extracted image: {extracted_path}")
                 return extracted_path
-            else:
-                # Extract the image
-                self.logger.info(f"Extracting image: {download_path}")
-                extracted_path = await self._extract_image(download_path, extracted_path)
+            
+            # Extract the image
+            self.logger.info(f"Extracting image: {download_path}")
+            marker_path.unlink(missing_ok=True)
+            extracted_path = await self._extract_image(download_path, extracted_path)
+        
+        if source_key is None:
+            st = download_path.stat()
+            source_key = f"{st.st_size}:{st.st_mtime_ns}"
+        marker_path.write_text(source_key)
+        return extracted_path
+    
+    def _extracted_cache_entry(self, checksum: str, checksum_type: str) -> Tuple[Path, str]:
+        """
+        Get the content-addressed cache entry of an extracted image.
+        
+        Args:
+            checksum: Checksum of the compressed image
+            checksum_type: Checksum algorithm
+            
+        Returns:
+            Tuple[Path, str]: Path of the extracted image and the key its
+            completion marker must contain
+        """
+        checksum = checksum.lower()
+        return self.extracted_cache_dir / f"{checksum[:16]}.img", f"{checksum_type}:{checksum}"
+    
+    def _is_extracted(self, extracted_path: Path, source_key: str) -> bool:
+        """
+        Check whether an extraction completed for the given source.
+        
+        Only images with a matching completion marker are reused, never
+        what a crashed extraction left behind.
+        
+        Args:
+            extracted_path: Path of the extracted image
+            source_key: Key of the compressed image it was extracted from
+            
+        Returns:
+            bool: True if the extracted image can be reused
+        """
+        marker_path = extracted_path.with_name(extracted_path.name + EXTRACTED_SUFFIX)
+        try:
+            return extracted_path.exists() and marker_path.read_text() == source_key
+        except OSError:
+            return False
+    
+    def _find_cached_extraction(self, image_path: Path) -> Optional[Path]:
+        """
+        Find a cached extraction of a compressed image by its content.
+        
+        The checksum comes from the verification sidecar of the compressed
+        image, so only images verified in their current state are matched.
+        
+        Args:
+            image_path: Path to the compressed image
+            
+        Returns:
+            Optional[Path]: Path of the extracted image, or None if not cached
+        """
+        for checksum_type in ("sha256", "md5"):
+            try:
+                with open(self._verified_path(image_path, checksum_type)) as f:
+                    size, mtime_ns, checksum = json.load(f)
+                st = image_path.stat()
+            except (OSError, ValueError):
+                continue
+            if (size, mtime_ns) != (st.st_size, st.st_mtime_ns):
+                continue
+            extracted_path, source_key = self._extracted_cache_entry(checksum, checksum_type)
+            if self._is_extracted(extracted_path, source_key):
                 return extracted_path
+        return None
+    
+    async def _download_verified(self, url: str, output_path: Path, checksum: Optional[str], checksum_type: str,
+                                 extract_to: Optional[Path] = None) -> None:
+        """
+        Download an image, verifying its checksum while the bytes arrive.
         
-        # If it's not compressed, just return the downloaded path
-        return download_path
+        Args:
+            url: URL to download from
+            output_path: Path to save the downloaded file
+            checksum: Expected checksum, or None to skip verification
+            checksum_type: Checksum algorithm (sha256, md5)
+            extract_to: Optional path to decompress the xz image to
+            
+        Raises:
+            ValueError: If the downloaded image does not match the checksum
+        """
+        hash_obj = self._new_hash(checksum_type) if checksum else None
+        await self.download_image(url, output_path, hash_obj, extract_to)
+        
+        if hash_obj is not None and hash_obj.hexdigest().lower() != checksum.lower():
+            output_path.unlink(missing_ok=True)
+            if extract_to is not None:
+                extract_to.unlink(missing_ok=True)
+            raise ValueError(f"Checksum verification failed for downloaded image")
+        if hash_obj is not None:
+            self._mark_verified(output_path, checksum, checksum_type)
     
-    async def download_image(self, url: str, output_path: Path) -> Path:
+    async def download_image(self, url: str, output_path: Path, hash_obj: Optional[Any] = None,
+                             extract_to: Optional[Path] = None) -> Path:
         """
         Download a Raspberry Pi OS image.
         
         Args:
             url: URL to download from
-            output_path: Path to save the downloaded file
+            output_path: Path to save the downloaded file, in an existing directory
+            hash_obj: Optional hash object updated with every downloaded chunk,
+                so the download is verified without reading the file again
+            extract_to: Optional path to decompress the downloaded xz image to
+                while it is downloading
             
         Returns:
             Path to the downloaded file
         """
-        # Ensure parent directories exist
-        output_path.parent.mkdir(parents=True, exist_ok=True)
+        download_config = self.config.get("download", {})
+        chunk_size = download_config.get("chunk_size", DOWNLOAD_CHUNK_SIZE)
+        connections = download_config.get("connections", DOWNLOAD_CONNECTIONS)
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        raise ValueError(f"Failed to download image: {response.status} {response.reason}")
+            session = self._get_session()
+            # Large files are fetched over several connections at once
+            if connections > 1:
+                size = await self._ranged_size(session, url)
+                if size is not None and size >= RANGED_DOWNLOAD_MIN_SIZE:
+                    try:
+                        async with contextlib.AsyncExitStack() as stack:
+                            extractor = None
+                            if extract_to is not None:
+                                extractor = await stack.enter_async_context(self._stream_extraction(extract_to))
+                            
+                            # Parts arrive out of order, hash and extract the
+                            # file front to back as its written prefix grows
+                            async def consume(data: bytes) -> None:
+                                if hash_obj is not None:
+                                    hash_obj.update(data)
+                                if extractor is not None:
+                                    extractor.write(data)
+                                    await extractor.drain()
+                            
+                            await self._ranged_download(
+                                session, url, output_path, size, connections, chunk_size,
+                                consume if hash_obj is not None or extractor is not None else None
+                            )
+                        return output_path
+                    except _RangeNotSupported:
+                        self.logger.info("Server ignores range requests, downloading over one connection")
+            
+            async with session.get(url) as response:
+                if response.status != 200:
+                    raise ValueError(f"Failed to download image: {response.status} {response.reason}")
+                
+                async with contextlib.AsyncExitStack() as stack:
+                    extractor = None
+                    if extract_to is not None:
+                        extractor = await stack.enter_async_context(self._stream_extraction(extract_to))
                     
-                    # Write the response content to file
-                    with open(output_path, 'wb') as f:
-                        while True:
-                            chunk = await response.content.read(1024 * 1024)  # 1MB chunks
-                            if not chunk:
-                                break
-                            f.write(chunk)
+                    # Write the response content to file without blocking the event loop
+                    async with aiofiles.open(output_path, 'wb') as f:
+                        if response.content_length:
+                            _preallocate(f.fileno(), response.content_length)
+                        async for chunk in response.content.iter_chunked(chunk_size):
+                            if hash_obj is not None:
+                                hash_obj.update(chunk)
+                            if extractor is not None:
+                                extractor.write(chunk)
+                                await extractor.drain()
+                            await f.write(chunk)
+                        # Drop any preallocated space the body did not fill
+                        await f.truncate()
             
             return output_path
             
@@ -188,59 +656,281 @@ class ImageBuilder:
                 output_path.unlink()  # Remove partial download on error
             raise ValueError(f"Image download failed: {str(e)}")
     
-    async def _extract_image(self, source_path: Path, target_path: Path) -> Path:
-        """Extract a compressed image."""
-        # Ensure target directory exists
-        target_path.parent.mkdir(parents=True, exist_ok=True)
+    @contextlib.asynccontextmanager
+    async def _stream_extraction(self, target_path: Path):
+        """
+        Decompress an xz stream into a file while it is being produced.
         
-        if source_path.suffix == ".xz":
-            # Use xz to decompress
+        Yields the stdin of the decompressor. The extracted image is complete
+        once the context exits without an error.
+        
+        Args:
+            target_path: Path to write the extracted image to, in an existing directory
+            
+        Raises:
+            DiskOperationError: If decompression fails
+        """
+        cmd = _xz_decompress_command()
+        with open(target_path, 'wb') as f:
             process = await asyncio.create_subprocess_exec(
-                'xz', '--decompress', '--keep', '--stdout', str(source_path),
-                stdout=asyncio.subprocess.PIPE,
+                self._tools.get(cmd[0], cmd[0]), *cmd[1:],
+                stdin=asyncio.subprocess.PIPE,
+                stdout=f,
                 stderr=asyncio.subprocess.PIPE
             )
+            # Collect errors as they are written, the process must never
+            # block on a full stderr pipe while we are feeding it
+            stderr_task = asyncio.ensure_future(process.stderr.read())
+            try:
+                try:
+                    yield process.stdin
+                    process.stdin.close()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The decompressor gave up early, report why below
+                    if await process.wait() == 0:
+                        raise
+                returncode = await process.wait()
+                stderr = await stderr_task
+            except BaseException:
+                if process.returncode is None:
+                    process.kill()
+                await process.wait()
+                stderr_task.cancel()
+                target_path.unlink(missing_ok=True)
+                raise
+        
+        if returncode != 0:
+            target_path.unlink(missing_ok=True)
+            raise DiskOperationError(
+                f"Image extraction failed with code {returncode}: "
+                f"{stderr.decode().strip()}"
+            )
+        self.logger.info(f"Image extraction complete: {target_path}")
+    
+    async def _ranged_size(self, session: Any, url: str) -> Optional[int]:
+        """
+        Get the size of a download if the server supports range requests.
+        
+        Args:
+            session: aiohttp client session
+            url: URL to download from
+            
+        Returns:
+            Optional[int]: Size in bytes, or None if ranges are not supported
+        """
+        try:
+            async with session.head(url, allow_redirects=True) as response:
+                if response.status != 200 or response.headers.get("Accept-Ranges") != "bytes":
+                    return None
+                return int(response.headers["Content-Length"])
+        except (aiohttp.ClientError, KeyError, ValueError):
+            return None
+    
+    async def _ranged_download(self, session: Any, url: str, output_path: Path, size: int,
+                               parts: int, chunk_size: int,
+                               consume: Optional[Callable[[bytes], Awaitable[None]]] = None) -> None:
+        """
+        Download a file as several byte ranges fetched concurrently.
+        
+        Each range is written at its own offset of a file of the final size.
+        
+        Args:
+            session: aiohttp client session
+            url: URL to download from
+            output_path: Path to save the downloaded file
+            size: Total size of the file in bytes
+            parts: Number of concurrent range requests
+            chunk_size: Read size per range request
+            consume: Optional callback receiving the file in order, read back
+                from the page cache as soon as all bytes before it are written
             
-            # Write output to file
-            with open(target_path, 'wb') as f:
-                while True:
-                    chunk = await process.stdout.read(1024 * 1024)  # 1MB chunks
-                    if not chunk:
-                        break
-                    f.write(chunk)
+        Raises:
+            _RangeNotSupported: If the server returns the full body for a range
+            ValueError: If a range ends early
+        """
+        part_size = -(-size // parts)
+        ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+        
+        # Next offset to write in each range, and a wakeup for the consumer
+        written = [start for start, _ in ranges]
+        progress = asyncio.Event()
+        
+        async def fetch(index: int, start: int, end: int) -> None:
+            headers = {"Range": f"bytes={start}-{end}"}
+            async with session.get(url, headers=headers) as response:
+                if response.status != 206:
+                    raise _RangeNotSupported()
+                offset = start
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    await asyncio.to_thread(os.pwrite, fd, chunk, offset)
+                    offset += len(chunk)
+                    written[index] = offset
+                    progress.set()
+                if offset != end + 1:
+                    raise ValueError(f"Range {start}-{end} ended at byte {offset}")
+        
+        async def feed() -> None:
+            fed = 0
+            index = 0
+            while fed < size:
+                # The written prefix ends in the first range not yet complete
+                while index < len(ranges) and written[index] > ranges[index][1]:
+                    index += 1
+                ready = size if index == len(ranges) else written[index]
+                if ready <= fed:
+                    progress.clear()
+                    await progress.wait()
+                    continue
+                while fed < ready:
+                    data = await asyncio.to_thread(os.pread, fd, min(chunk_size, ready - fed), fed)
+                    await consume(data)
+                    fed += len(data)
+        
+        fd = os.open(output_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            _preallocate(fd, size)
+            tasks = [asyncio.ensure_future(fetch(index, start, end)) for index, (start, end) in enumerate(ranges)]
+            if consume is not None:
+                tasks.append(asyncio.ensure_future(feed()))
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # Stop the other ranges before the file descriptor is closed
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        finally:
+            os.close(fd)
+    
+    async def _extract_image(self, source_path: Path, target_path: Path) -> Path:
+        """
+        Extract a compressed image.
+        
+        Args:
+            source_path: Path to the compressed image
+            target_path: Path to write the extracted image to, in an existing directory
+            
+        Returns:
+            Path: Path to the extracted image
+            
+        Raises:
+            DiskOperationError: If extraction fails
+            NotImplementedError: For ZIP archives
+        """
+        if source_path.suffix == ".xz":
+            self.logger.info("Extracting XZ compressed image")
             
-            stderr = await process.stderr.read()
-            await process.wait()
+            if source_path.stat().st_size < LZMA_IN_PROCESS_MAX_SIZE:
+                try:
+                    await asyncio.to_thread(_lzma_decompress, source_path, target_path)
+                    self.logger.info(f"Image extraction complete: {target_path}")
+                    return target_path
+                except (lzma.LZMAError, EOFError):
+                    # Corrupt or truncated stream: let xz decode it or report why it cannot
+                    target_path.unlink(missing_ok=True)
+                except OSError as e:
+                    target_path.unlink(missing_ok=True)
+                    raise DiskOperationError(f"Image extraction failed: {str(e)}")
             
-            if process.returncode != 0:
-                raise RuntimeError(f"Failed to extract image: {stderr.decode()}")
+            try:
+                # Use xz to decompress, writing straight into the target file
+                # so the image never passes through Python
+                expected_size = self.config.get("base_image", {}).get("expected_extracted_size")
+                with _sequential_read(source_path) as src, open(target_path, 'wb') as f:
+                    if expected_size:
+                        _preallocate(f.fileno(), expected_size)
+                    returncode, _, stderr = await self._run(*_xz_decompress_command(), stdin=src, stdout=f)
+                    if expected_size:
+                        # xz shares the file offset, cut the file where it stopped
+                        f.truncate(os.lseek(f.fileno(), 0, os.SEEK_CUR))
+                
+                if returncode != 0:
+                    raise DiskOperationError(
+                        f"Image extraction failed with code {returncode}: "
+                        f"{stderr.decode().strip()}"
+                    )
+                
+            except Exception as e:
+                # Remove partial extraction if it exists
+                target_path.unlink(missing_ok=True)
+                raise DiskOperationError(f"Image extraction failed: {str(e)}")
             
+            self.logger.info(f"Image extraction complete: {target_path}")
             return target_path
+        
+        elif source_path.suffix == ".zip":
+            # TODO: Implement ZIP extraction if needed
+            raise NotImplementedError("ZIP extraction not yet implemented")
+        
         else:
             # Just copy the file if it's not compressed
-            shutil.copy2(source_path, target_path)
+            await asyncio.to_thread(_copy_file, source_path, target_path)
             return target_path
     
-    async def _verify_checksum(self, file_path: Path, expected_checksum: str, checksum_type: str = "sha256") -> bool:
-        """Verify file checksum."""
-        hash_obj = None
-        
+    def _new_hash(self, checksum_type: str):
+        """Create a hash object for a supported checksum type."""
         if checksum_type == "sha256":
-            hash_obj = hashlib.sha256()
+            return hashlib.sha256()
         elif checksum_type == "md5":
-            hash_obj = hashlib.md5()
+            return hashlib.md5()
         else:
             raise ValueError(f"Unsupported checksum type: {checksum_type}")
+    
+    async def _verify_checksum(self, file_path: Path, expected_checksum: str, checksum_type: str = "sha256") -> bool:
+        """Verify file checksum."""
+        # Skip hashing if the file is unchanged since it last passed
+        if self._is_verified(file_path, expected_checksum, checksum_type):
+            return True
         
-        with open(file_path, 'rb') as f:
-            while True:
-                data = f.read(65536)  # 64K chunks
-                if not data:
-                    break
-                hash_obj.update(data)
+        hash_obj = self._new_hash(checksum_type)
+        await asyncio.to_thread(_hash_file_into, file_path, hash_obj)
         
         calculated_checksum = hash_obj.hexdigest()
-        return calculated_checksum.lower() == expected_checksum.lower()
+        if calculated_checksum.lower() != expected_checksum.lower():
+            return False
+        self._mark_verified(file_path, expected_checksum, checksum_type)
+        return True
+    
+    def _verified_path(self, file_path: Path, checksum_type: str) -> Path:
+        """Get the path of the verification sidecar of a file."""
+        return file_path.with_name(f"{file_path.name}.{checksum_type}{VERIFIED_SUFFIX}")
+    
+    def _is_verified(self, file_path: Path, checksum: str, checksum_type: str) -> bool:
+        """
+        Check whether a file passed this checksum and is unchanged since.
+        
+        Args:
+            file_path: File to check
+            checksum: Expected checksum
+            checksum_type: Checksum algorithm
+            
+        Returns:
+            bool: True if the sidecar matches the file's size and mtime
+        """
+        try:
+            st = file_path.stat()
+            with open(self._verified_path(file_path, checksum_type)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return record == [st.st_size, st.st_mtime_ns, checksum.lower()]
+    
+    def _mark_verified(self, file_path: Path, checksum: str, checksum_type: str) -> None:
+        """
+        Record that a file passed a checksum check.
+        
+        Args:
+            file_path: Verified file
+            checksum: Checksum the file matched
+            checksum_type: Checksum algorithm
+        """
+        st = file_path.stat()
+        try:
+            with open(self._verified_path(file_path, checksum_type), "w") as f:
+                json.dump([st.st_size, st.st_mtime_ns, checksum.lower()], f)
+        except OSError as e:
+            self.logger.debug(f"Could not record checksum verification for {file_path}: {e}")
     
     async def extract_image(self, image_path: Path) -> Path:
         """
@@ -262,47 +952,17 @@ class ImageBuilder:
             self.logger.info(f"Using existing extracted image: {output_path}")
             return output_path
         
-        # Extract based on file extension
-        if str(image_path).endswith(".xz"):
-            self.logger.info("Extracting XZ compressed image")
-            
-            # Run xz decompression
-            cmd = ["xz", "--decompress", "--stdout", str(image_path)]
-            
-            try:
-                with open(output_path, "wb") as f:
-                    process = await asyncio.create_subprocess_exec(
-                        *cmd,
-                        stdout=f,
-                        stderr=asyncio.subprocess.PIPE
-                    )
-                    
-                    _, stderr = await process.communicate()
-                    
-                    if process.returncode != 0:
-                        raise DiskOperationError(
-                            f"Image extraction failed with code {process.returncode}: "
-                            f"{stderr.decode().strip()}"
-                        )
-                
-                self.logger.info(f"Image extraction complete: {output_path}")
-                return output_path
-                
-            except Exception as e:
-                # Remove partial extraction if it exists
-                if output_path.exists():
-                    output_path.unlink()
-                
-                raise DiskOperationError(f"Image extraction failed: {str(e)}")
-                
-        elif str(image_path).endswith(".zip"):
-            # TODO: Implement ZIP extraction if needed
-            raise NotImplementedError("ZIP extraction not yet implemented")
-            
-        else:
-            # Just copy the file
-            shutil.copy(image_path, output_path)
+        # The same base image is shared by all hives; copy an extraction that
+        # is already cached for this content instead of decompressing again.
+        # The copy is sparse and shares blocks on Btrfs/XFS, and keeps the
+        # cached image untouched by later modifications
+        cached_path = self._find_cached_extraction(image_path)
+        if cached_path is not None:
+            self.logger.info(f"Copying cached extracted image: {cached_path}")
+            await asyncio.to_thread(_copy_file, cached_path, output_path)
             return output_path
+        
+        return await self._extract_image(image_path, output_path)
     
     @retry(max_retries=3, delay=1.0, exceptions=(DiskOperationError,))
     async def mount_image(self, image_path: Path) -> Tuple[Path, Path]:
@@ -327,94 +987,48 @@ class ImageBuilder:
         boot_mount.mkdir(exist_ok=True)
         root_mount.mkdir(exist_ok=True)
         
-        # Create loop device
+        # Locate the partitions from the MBR so they can be mounted straight
+        # from the image file; images without one go through losetup -P
         try:
-            # Find free loop device
-            loop_cmd = ["losetup", "-f"]
-            process = await asyncio.create_subprocess_exec(
-                *loop_cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode != 0:
-                raise DiskOperationError(
-                    f"Failed to find free loop device: {stderr.decode().strip()}"
+            partitions = read_partition_table(image_path)
+        except (OSError, ValueError) as e:
+            self.logger.info(f"Cannot read partition table, using loop device partitions: {e}")
+            partitions = []
+        
+        try:
+            if len(partitions) >= 2:
+                (boot_offset, boot_size), (root_offset, root_size) = partitions[:2]
+                image_path_str = str(image_path)
+                await self._mount_partitions(
+                    (image_path_str, f"loop,offset={boot_offset},sizelimit={boot_size}"),
+                    (image_path_str, f"loop,offset={root_offset},sizelimit={root_size}"),
+                    boot_mount, root_mount
                 )
+                return boot_mount, root_mount
             
-            loop_device = stdout.decode().strip()
-            
-            # Set up loop device with partition scanning
-            setup_cmd = ["losetup", "-P", loop_device, str(image_path)]
-            process = await asyncio.create_subprocess_exec(
-                *setup_cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            _, stderr = await process.communicate()
-            
-            if process.returncode != 0:
-                raise DiskOperationError(
-                    f"Failed to set up loop device: {stderr.decode().strip()}"
-                )
+            # Set up a loop device with partition scanning through
+            # /dev/loop-control, or losetup where the ioctls are refused
+            try:
+                loop_device = await asyncio.to_thread(attach_loop_device, image_path)
+            except OSError as e:
+                self.logger.debug(f"Cannot attach loop device directly, using losetup: {e}")
+                loop_device = await self._losetup_attach(image_path)
             
             self.loop_device = loop_device
             self.logger.info(f"Created loop device: {loop_device}")
             
             # Wait for partition device nodes to appear
-            for _ in range(10):  # Wait up to 10 seconds
-                if (Path(f"{loop_device}p1").exists() and 
-                    Path(f"{loop_device}p2").exists()):
-                    break
-                await asyncio.sleep(1)
-            else:
+            if not await wait_for_device_nodes([(f"{loop_device}p1", f"{loop_device}p2")], timeout=10.0):
                 raise DiskOperationError(
                     f"Partition device nodes did not appear for {loop_device}"
                 )
             
-            # Mount boot partition
-            boot_cmd = ["mount", f"{loop_device}p1", str(boot_mount)]
-            process = await asyncio.create_subprocess_exec(
-                *boot_cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            await self._mount_partitions(
+                (f"{loop_device}p1", None),
+                (f"{loop_device}p2", None),
+                boot_mount, root_mount
             )
             
-            _, stderr = await process.communicate()
-            
-            if process.returncode != 0:
-                raise DiskOperationError(
-                    f"Failed to mount boot partition: {stderr.decode().strip()}"
-                )
-            
-            self.boot_mount = boot_mount
-            self.logger.info(f"Mounted boot partition at {boot_mount}")
-            
-            # Mount root partition
-            root_cmd = ["mount", f"{loop_device}p2", str(root_mount)]
-            process = await asyncio.create_subprocess_exec(
-                *root_cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            _, stderr = await process.communicate()
-            
-            if process.returncode != 0:
-                # Unmount boot and detach loop if root fails
-                await self._unmount_partition(boot_mount)
-                await self._detach_loop_device(loop_device)
-                
-                raise DiskOperationError(
-                    f"Failed to mount root partition: {stderr.decode().strip()}"
-                )
-            
-            self.root_mount = root_mount
-            self.logger.info(f"Mounted root partition at {root_mount}")
-            
             return boot_mount, root_mount
             
         except Exception as e:
@@ -433,62 +1047,142 @@ class ImageBuilder:
             
             raise DiskOperationError(f"Failed to mount image: {str(e)}")
     
+    async def _losetup_attach(self, image_path: Path) -> str:
+        """
+        Attach an image to a free loop device with losetup.
+        
+        Args:
+            image_path: Path to the disk image
+            
+        Returns:
+            str: Path of the loop device
+            
+        Raises:
+            DiskOperationError: If losetup fails
+        """
+        # Find free loop device
+        returncode, stdout, stderr = await self._run("losetup", "-f")
+        
+        if returncode != 0:
+            raise DiskOperationError(
+                f"Failed to find free loop device: {stderr.decode().strip()}"
+            )
+        
+        loop_device = stdout.decode().strip()
+        
+        # Set up loop device with partition scanning
+        returncode, _, stderr = await self._run("losetup", "-P", loop_device, str(image_path), stdout=asyncio.subprocess.DEVNULL)
+        
+        if returncode != 0:
+            raise DiskOperationError(
+                f"Failed to set up loop device: {stderr.decode().strip()}"
+            )
+        
+        return loop_device
+    
+    async def _mount_partitions(self, boot_source: Tuple[str, Optional[str]], root_source: Tuple[str, Optional[str]],
+                                boot_mount: Path, root_mount: Path) -> None:
+        """
+        Mount the boot and root partitions concurrently.
+        
+        The two mounts are independent, so both are started at once. Mounts
+        that succeed are recorded on the builder even if the other one
+        fails, so the caller can clean them up.
+        
+        Args:
+            boot_source: (device or image, mount options) of the boot partition
+            root_source: (device or image, mount options) of the root partition
+            boot_mount: Mount point of the boot partition
+            root_mount: Mount point of the root partition
+            
+        Raises:
+            DiskOperationError: If either mount fails
+        """
+        boot_result, root_result = await asyncio.gather(
+            self._mount(*boot_source, boot_mount, "boot"),
+            self._mount(*root_source, root_mount, "root"),
+            return_exceptions=True
+        )
+        
+        if not isinstance(boot_result, BaseException):
+            self.boot_mount = boot_mount
+            self.logger.info(f"Mounted boot partition at {boot_mount}")
+        if not isinstance(root_result, BaseException):
+            self.root_mount = root_mount
+            self.logger.info(f"Mounted root partition at {root_mount}")
+        
+        for result in (boot_result, root_result):
+            if isinstance(result, BaseException):
+                raise result
+    
+    async def _mount(self, source: str, options: Optional[str], mount_point: Path, name: str) -> None:
+        """
+        Mount a partition.
+        
+        Args:
+            source: Partition device, or image file when mounting by offset
+            options: Mount options, e.g. "loop,offset=N,sizelimit=M"
+            mount_point: Directory to mount the partition on
+            name: Partition name used in error messages
+            
+        Raises:
+            DiskOperationError: If mounting fails
+        """
+        cmd = ["mount"]
+        if options:
+            cmd += ["-o", options]
+        cmd += [source, str(mount_point)]
+        
+        returncode, _, stderr = await self._run(*cmd, stdout=asyncio.subprocess.DEVNULL)
+        
+        if returncode != 0:
+            raise DiskOperationError(
+                f"Failed to mount {name} partition: {stderr.decode().strip()}"
+            )
+    
     async def unmount_image(self) -> None:
         """Unmount any mounted partitions and detach loop devices."""
         self.logger.info("Unmounting image")
         
         # Check if there are mount points in the build state
         if hasattr(self, 'build_state'):
-            # Unmount root first (must be in reverse order of mounting)
-            if "root_mount" in self.build_state:
-                root_mount = self.build_state["root_mount"]
-                self.logger.debug(f"Unmounting root partition: {root_mount}")
-                try:
-                    process = await asyncio.create_subprocess_exec(
-                        'umount', str(root_mount),
-                        stdout=asyncio.subprocess.PIPE,
-                        stderr=asyncio.subprocess.PIPE
-                    )
-                    _, stderr = await process.communicate()
-                    if process.returncode != 0:
-                        self.logger.warning(f"Failed to unmount root partition: {stderr.decode()}")
-                except Exception as e:
-                    self.logger.warning(f"Error unmounting root partition: {str(e)}")
-            
-            # Then unmount boot
-            if "boot_mount" in self.build_state:
-                boot_mount = self.build_state["boot_mount"]
-                self.logger.debug(f"Unmounting boot partition: {boot_mount}")
-                try:
-                    process = await asyncio.create_subprocess_exec(
-                        'umount', str(boot_mount),
-                        stdout=asyncio.subprocess.PIPE,
-                        stderr=asyncio.subprocess.PIPE
-                    )
-                    _, stderr = await process.communicate()
-                    if process.returncode != 0:
-                        self.logger.warning(f"Failed to unmount boot partition: {stderr.decode()}")
-                except Exception as e:
-                    self.logger.warning(f"Error unmounting boot partition: {str(e)}")
+            # Boot is not mounted below root, so both can be unmounted at once
+            unmounts = [
+                self._unmount_logged(self.build_state[key], name)
+                for key, name in (("root_mount", "root"), ("boot_mount", "boot"))
+                if key in self.build_state
+            ]
+            await asyncio.gather(*unmounts)
             
             # Finally detach any loop devices
             if "loop_device" in self.build_state:
                 loop_device = self.build_state["loop_device"]
                 self.logger.debug(f"Detaching loop device: {loop_device}")
                 try:
-                    process = await asyncio.create_subprocess_exec(
-                        'losetup', '--detach', loop_device,
-                        stdout=asyncio.subprocess.PIPE,
-                        stderr=asyncio.subprocess.PIPE
-                    )
-                    _, stderr = await process.communicate()
-                    if process.returncode != 0:
+                    returncode, _, stderr = await self._run('losetup', '--detach', loop_device, stdout=asyncio.subprocess.DEVNULL)
+                    if returncode != 0:
                         self.logger.warning(f"Failed to detach loop device: {stderr.decode()}")
                 except Exception as e:
                     self.logger.warning(f"Error detaching loop device: {str(e)}")
         
         # Sync filesystem to ensure all changes are written
-        await asyncio.create_subprocess_exec('sync')
+        await self._run('sync', stdout=asyncio.subprocess.DEVNULL)
+    
+    async def _unmount_logged(self, mount_point: Path, name: str) -> None:
+        """
+        Unmount a partition, logging instead of raising on failure.
+        
+        Args:
+            mount_point: Mount point to unmount
+            name: Partition name used in log messages
+        """
+        self.logger.debug(f"Unmounting {name} partition: {mount_point}")
+        try:
+            returncode, _, stderr = await self._run('umount', str(mount_point), stdout=asyncio.subprocess.DEVNULL)
+            if returncode != 0:
+                self.logger.warning(f"Failed to unmount {name} partition: {stderr.decode()}")
+        except Exception as e:
+            self.logger.warning(f"Error unmounting {name} partition: {str(e)}")
     
     async def _unmount_partition(self, mount_point: Path) -> None:
         """
@@ -504,17 +1198,11 @@ class ImageBuilder:
         
         # Try unmounting with increasing force
         for attempt, options in enumerate([[], ["-l"], ["-f"]]):
-            cmd = ["umount"] + options + [str(mount_point)]
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            returncode, _, stderr = await self._run(
+                "umount", *options, str(mount_point), stdout=asyncio.subprocess.DEVNULL
             )
             
-            _, stderr = await process.communicate()
-            
-            if process.returncode == 0:
+            if returncode == 0:
                 self.logger.info(f"Successfully unmounted {mount_point}")
                 return
             
@@ -540,17 +1228,9 @@ class ImageBuilder:
         """
         self.logger.info(f"Detaching loop device {loop_device}")
         
-        cmd = ["losetup", "-d", loop_device]
-        
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        _, stderr = await process.communicate()
+        returncode, _, stderr = await self._run("losetup", "-d", loop_device, stdout=asyncio.subprocess.DEVNULL)
         
-        if process.returncode != 0:
+        if returncode != 0:
             self.logger.error(
                 f"Failed to detach loop device: {stderr.decode().strip()}"
             )
@@ -562,12 +1242,23 @@ class ImageBuilder:
         """
         Compress the image for distribution.
         
+        Uses xz unless output.compression selects zstd, which reaches a
+        similar ratio with --long several times faster.
+        
         Args:
             image_path: Path to the image file
             
         Returns:
             Path: Path to the compressed image
+            
+        Raises:
+            ValueError: If output.compression is not xz or zstd
+            DiskOperationError: If compression fails
         """
+        compression = self.config.get("output", {}).get("compression", "xz")
+        if compression not in ("xz", "zstd"):
+            raise ValueError(f"Unsupported compression: {compression}")
+        
         try:
             self.logger.info(f"Compressing image: {image_path}")
             
@@ -580,24 +1271,30 @@ class ImageBuilder:
             
             # Generate output filename
             hive_id = self.config.get("hive_id", "unknown")
-            output_filename = f"w4b_hive_{hive_id}_{timestamp}.img.xz"
+            suffix = ".img.zst" if compression == "zstd" else ".img.xz"
+            output_filename = f"w4b_hive_{hive_id}_{timestamp}{suffix}"
             output_path = output_dir / output_filename
             
-            # Run xz compression
-            cmd = ["xz", "--threads=0", "-9", "-c", str(image_path)]
+            # Run xz compression; -9 is barely smaller than -6 on disk images but
+            # needs far more memory per thread, which caps xz's parallelism.
+            # Independent blocks also let the image be decompressed in parallel
+            compress_config = self.config.get("compress", {})
+            threads = compress_config.get("threads", 0)
+            if compression == "zstd":
+                level = compress_config.get("level", 19)
+                cmd = ["zstd", f"-T{threads}", f"-{level}", "--long", "-c"]
+            else:
+                level = compress_config.get("level", 6)
+                cmd = ["xz", f"--threads={threads}", f"-{level}", "--block-size=16MiB", "-c"]
             
-            with open(output_path, "wb") as f:
-                process = await asyncio.create_subprocess_exec(
-                    *cmd,
-                    stdout=f,
-                    stderr=asyncio.subprocess.PIPE
-                )
+            # The compressor reads the image and writes the archive through the file
+            # descriptors directly, nothing passes through Python
+            with _sequential_read(image_path) as src, open(output_path, "wb") as f:
+                returncode, _, stderr = await self._run(*cmd, stdin=src, stdout=f)
                 
-                _, stderr = await process.communicate()
-                
-                if process.returncode != 0:
+                if returncode != 0:
                     raise DiskOperationError(
-                        f"Image compression failed with code {process.returncode}: "
+                        f"Image compression failed with code {returncode}: "
                         f"{stderr.decode().strip()}"
                     )
             
@@ -615,31 +1312,47 @@ class ImageBuilder:
         """
         Generate checksums for a file.
         
+        The algorithms are taken from checksums.algorithms (sha256 only by default).
+        
         Args:
             file_path: Path to the file
             
         Returns:
             Dict[str, str]: Dictionary of hash algorithms to checksums
         """
-        self.logger.info(f"Generating checksums for {file_path}")
+        algorithms = tuple(self.config.get("checksums", {}).get("algorithms", DEFAULT_CHECKSUM_ALGORITHMS))
+        self.logger.info(f"Generating {', '.join(algorithms)} checksums for {file_path}")
         
-        algorithms = {
-            "md5": hashlib.md5(),
-            "sha1": hashlib.sha1(),
-            "sha256": hashlib.sha256()
-        }
+        # Only the OpenSSL backend uses the CPU's SHA instructions
+        if hashlib.sha256.__module__ != "_hashlib":
+            self.logger.warning("hashlib is not backed by OpenSSL, image checksums will be slow")
         
-        # Calculate hashes in chunks
-        buffer_size = 65536  # 64KB chunks
+        return await asyncio.to_thread(self._compute_checksums, file_path, algorithms)
+    
+    def _compute_checksums(self, file_path: Path, algorithms: Tuple[str, ...]) -> Dict[str, str]:
+        """
+        Compute several checksums of a file.
         
-        with open(file_path, "rb") as f:
-            while True:
-                data = f.read(buffer_size)
-                if not data:
-                    break
-                for hasher in algorithms.values():
-                    hasher.update(data)
+        Each algorithm hashes the file through its own descriptor in its own
+        thread (hashlib releases the GIL for large buffers), so the pages
+        are read from disk once and shared through the page cache. They are
+        dropped from the cache only after all threads are done.
         
-        checksums = {name: hasher.hexdigest() for name, hasher in algorithms.items()}
+        Args:
+            file_path: Path to the file
+            algorithms: Names of the hashlib algorithms to use
+            
+        Returns:
+            Dict[str, str]: Dictionary of hash algorithms to checksums
+        """
+        hashers = [hashlib.new(name) for name in algorithms]
+        
+        hash_into = functools.partial(_hash_file_into, file_path, drop_cache=False)
+        with ThreadPoolExecutor(max_workers=len(hashers)) as pool:
+            list(pool.map(hash_into, hashers))
+        
+        # Drop the pages once every algorithm is done with them
+        with _sequential_read(file_path):
+            pass
         
-        return checksums
+        return {name: hasher.hexdigest() for name, hasher in zip(algorithms, hashers)}
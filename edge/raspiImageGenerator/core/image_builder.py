@@ -5,9 +5,12 @@ Image Builder for Raspberry Pi OS
 import os
 import logging
 import asyncio
+import subprocess
 from pathlib import Path
 from typing import Dict, Any
 
+from utils.loop_utils import wait_for_device_nodes
+
 class ImageBuilder:
     """
     Builds and modifies Raspberry Pi OS images.
@@ -54,12 +57,14 @@ class ImageBuilder:
             bool: True if successful, False otherwise
         """
         try:
+            image_path = str(self.state["image_path"])
+            
             # Force detach any existing loop devices for this image
-            await self._force_detach_existing_loops(self.state["image_path"])
+            await self._force_detach_existing_loops(image_path)
             
             # Use losetup with -P flag to force kernel to scan partition table
             result = await asyncio.create_subprocess_exec(
-                'losetup', '-P', '-f', '--show', str(self.state["image_path"]),
+                'losetup', '-P', '-f', '--show', image_path,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE
             )
@@ -78,7 +83,9 @@ class ImageBuilder:
             
             # Wait for partitions to be recognized (important!)
             self.logger.info("Waiting for kernel to recognize partitions...")
-            await asyncio.sleep(2)
+            await wait_for_device_nodes(
+                [(f"{self.loop_device}p1", f"{self.loop_device}p2")], timeout=2.0
+            )
             
             # Debug: List the loop device partitions
             self._debug_partitions(self.loop_device)
@@ -98,33 +105,19 @@ class ImageBuilder:
                 await self._cleanup_loop_device(self.loop_device)
                 return False
                 
-            # Mount boot partition
-            self.logger.info(f"Mounting boot partition: {boot_part} -> {self.boot_mount}")
-            boot_result = await asyncio.create_subprocess_exec(
-                'mount', boot_part, str(self.boot_mount),
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            boot_stdout, boot_stderr = await boot_result.communicate()
-            
-            if boot_result.returncode != 0:
-                self.logger.error(f"Failed to mount boot partition: {boot_stderr.decode().strip()}")
-                await self._cleanup_loop_device(self.loop_device)
-                return False
-            
-            # Mount root partition
-            self.logger.info(f"Mounting root partition: {root_part} -> {self.root_mount}")
-            root_result = await asyncio.create_subprocess_exec(
-                'mount', root_part, str(self.root_mount),
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            # Mount boot and root partitions concurrently
+            boot_ok, root_ok = await asyncio.gather(
+                self._mount_partition("boot", boot_part, self.boot_mount),
+                self._mount_partition("root", root_part, self.root_mount)
             )
-            root_stdout, root_stderr = await root_result.communicate()
             
-            if root_result.returncode != 0:
-                self.logger.error(f"Failed to mount root partition: {root_stderr.decode().strip()}")
-                # Clean up boot mount
-                await asyncio.create_subprocess_exec('umount', str(self.boot_mount))
+            if not (boot_ok and root_ok):
+                # Clean up whichever mount succeeded
+                await asyncio.gather(*(
+                    self._unmount(mount_point)
+                    for mounted, mount_point in ((boot_ok, self.boot_mount), (root_ok, self.root_mount))
+                    if mounted
+                ))
                 await self._cleanup_loop_device(self.loop_device)
                 return False
             
@@ -144,14 +137,61 @@ class ImageBuilder:
                 await self._cleanup_loop_device(self.loop_device)
             return False
     
-    async def _force_detach_existing_loops(self, image_path: Path) -> None:
+    async def _mount_partition(self, name: str, partition: str, mount_point: Path) -> bool:
+        """
+        Mount a partition.
+        
+        Args:
+            name: Partition name used in log messages
+            partition: Partition device
+            mount_point: Directory to mount the partition on
+            
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        self.logger.info(f"Mounting {name} partition: {partition} -> {mount_point}")
+        result = await asyncio.create_subprocess_exec(
+            'mount', partition, str(mount_point),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await result.communicate()
+        
+        if result.returncode != 0:
+            self.logger.error(f"Failed to mount {name} partition: {stderr.decode().strip()}")
+            return False
+        return True
+    
+    async def _unmount(self, mount_point: Path) -> bool:
+        """
+        Unmount a partition.
+        
+        Args:
+            mount_point: Mount point to unmount
+            
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        result = await asyncio.create_subprocess_exec(
+            'umount', str(mount_point),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await result.communicate()
+        
+        if result.returncode != 0:
+            self.logger.warning(f"Failed to unmount {mount_point}: {stderr.decode().strip()}")
+            return False
+        return True
+    
+    async def _force_detach_existing_loops(self, image_path: str) -> None:
         """Forcibly detach any existing loop devices for this image"""
         try:
             # Find if the image is already attached to a loop device
             result = await asyncio.create_subprocess_exec(
-                'losetup', '-j', str(image_path),
+                'losetup', '-j', image_path,
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+                stderr=asyncio.subprocess.DEVNULL
             )
             stdout, _ = await result.communicate()
             
@@ -165,12 +205,14 @@ class ImageBuilder:
                     loop_dev = line.split(':')[0]
                     self.logger.info(f"Detaching existing loop device: {loop_dev}")
                     
-                    # Try to detach the loop device
-                    await asyncio.create_subprocess_exec(
+                    # Try to detach the loop device; nothing reads its output,
+                    # so don't give it pipes that could fill up
+                    detach = await asyncio.create_subprocess_exec(
                         'losetup', '-d', loop_dev,
-                        stdout=asyncio.subprocess.PIPE,
-                        stderr=asyncio.subprocess.PIPE
+                        stdout=asyncio.subprocess.DEVNULL,
+                        stderr=asyncio.subprocess.DEVNULL
                     )
+                    await detach.wait()
         except Exception as e:
             self.logger.warning(f"Error detaching existing loop devices: {str(e)}")
 
@@ -185,9 +227,8 @@ class ImageBuilder:
             self.logger.info(f"Found partition nodes: {partitions}")
             
             # Run fdisk to show partition table
-            os.system(f"fdisk -l {loop_device} > /tmp/fdisk_debug.txt")
-            with open('/tmp/fdisk_debug.txt', 'r') as f:
-                self.logger.info(f"Partition table:\n{f.read()}")
+            result = subprocess.run(['fdisk', '-l', loop_device], capture_output=True, text=True)
+            self.logger.info(f"Partition table:\n{result.stdout}")
         except Exception as e:
             self.logger.warning(f"Error debugging partitions: {str(e)}")
 
@@ -224,9 +265,6 @@ class ImageBuilder:
         if kpartx_stderr:
             self.logger.info(f"kpartx stderr: {kpartx_stderr.decode()}")
         
-        # Wait for device mapper to create nodes
-        await asyncio.sleep(3)
-        
         # Check device mapper nodes
         loop_name = os.path.basename(loop_device)
         mapper_candidates = [
@@ -235,6 +273,9 @@ class ImageBuilder:
             (f"/dev/mapper/loop{loop_name.replace('loop', '')}p1", f"/dev/mapper/loop{loop_name.replace('loop', '')}p2")
         ]
         
+        # Wait for device mapper to create nodes
+        await wait_for_device_nodes(mapper_candidates, timeout=3.0)
+        
         for boot_candidate, root_candidate in mapper_candidates:
             self.logger.info(f"Checking mapper devices: {boot_candidate}, {root_candidate}")
             if Path(boot_candidate).exists() and Path(root_candidate).exists():
@@ -269,10 +310,10 @@ class ImageBuilder:
             self.logger.info("Cleaning up kpartx mappings...")
             kpartx_result = await asyncio.create_subprocess_exec(
                 'kpartx', '-d', loop_device,
-                stdout=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
                 stderr=asyncio.subprocess.PIPE
             )
-            kpartx_stdout, kpartx_stderr = await kpartx_result.communicate()
+            _, kpartx_stderr = await kpartx_result.communicate()
             
             if kpartx_stderr:
                 self.logger.info(f"kpartx cleanup stderr: {kpartx_stderr.decode()}")
@@ -281,7 +322,7 @@ class ImageBuilder:
             self.logger.info(f"Detaching loop device: {loop_device}")
             detach_result = await asyncio.create_subprocess_exec(
                 'losetup', '-d', loop_device,
-                stdout=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
                 stderr=asyncio.subprocess.PIPE
             )
             _, stderr = await detach_result.communicate()
@@ -305,10 +346,10 @@ class ImageBuilder:
             return False
             
         # Check for essential directories/files
-        if not (Path(boot_mount) / "config.txt").exists():
+        if not os.path.exists(os.path.join(boot_mount, "config.txt")):
             return False
             
-        if not (Path(root_mount) / "etc").exists() or not (Path(root_mount) / "usr").exists():
+        if not os.path.exists(os.path.join(root_mount, "etc")) or not os.path.exists(os.path.join(root_mount, "usr")):
             return False
             
         return True
@@ -329,10 +370,9 @@ class ImageBuilder:
             boot_mount = Path(self.state["boot_mount"])
             root_mount = Path(self.state["root_mount"])
             
-            # Unmount the image
+            # Unmount the image; boot is not mounted below root, so both go at once
             self.logger.info("Unmounting image")
-            os.system(f"umount {root_mount}")
-            os.system(f"umount {boot_mount}")
+            await asyncio.gather(self._unmount(root_mount), self._unmount(boot_mount))
             
             return True
         except Exception as e:
@@ -188,6 +188,7 @@ class BuildPipeline:
                 await self.image_builder.unmount_image()
             except Exception as e:
                 self.logger.error(f"Error during cleanup: {str(e)}")
+            await self.image_builder.close()
             # Clean up mounted filesystems and loop devices at the end
             await self._cleanup_resources()
     
@@ -6,6 +6,7 @@ Download stage for Raspberry Pi image generator.
 import os
 import sys
 import asyncio
+import hashlib
 import shutil
 from pathlib import Path
 from typing import Dict, Any, Optional
@@ -80,7 +81,10 @@ class DownloadStage(BuildStage):
                 image_url = self._get_image_url()
                 download_path.parent.mkdir(parents=True, exist_ok=True)
                 
-                if not await self._download_image(image_url, download_path):
+                if not await self._download_image(
+                    image_url, download_path,
+                    checksum=image_info["checksum"], checksum_type=image_info["checksum_type"]
+                ):
                     self.logger.error("Failed to download image")
                     return False
                     
@@ -126,14 +130,20 @@ class DownloadStage(BuildStage):
             "compressed": config.get("compressed", True)
         }
     
-    async def _download_image(self, url: str, target_path: Path, resume: bool = False) -> bool:
+    async def _download_image(self, url: str, target_path: Path, resume: bool = False,
+                              checksum: Optional[str] = None, checksum_type: str = "sha256") -> bool:
         """
         Download an image file from URL to target path with progress tracking and resumption.
         
+        A fresh download with a known checksum is hashed while it arrives, so
+        it never has to be read back from disk for verification.
+        
         Args:
             url: URL to download from
             target_path: Path to save to
             resume: Whether to attempt to resume a partial download
+            checksum: Expected checksum of the complete file, if known
+            checksum_type: Algorithm of the expected checksum
             
         Returns:
             bool: True if successful, False otherwise
@@ -161,7 +171,8 @@ class DownloadStage(BuildStage):
             # Use aiohttp for better async handling
             import aiohttp
             
-            async with aiohttp.ClientSession() as session:
+            # A read buffer of several chunks keeps the 1MB reads below cheap
+            async with aiohttp.ClientSession(read_bufsize=4 * 1024 * 1024) as session:
                 async with session.get(url, headers=headers) as response:
                     if response.status == 200 or response.status == 206:  # OK or Partial Content
                         total_size = int(response.headers.get('content-length', 0))
@@ -172,10 +183,24 @@ class DownloadStage(BuildStage):
                             self.logger.info(f"File size: {total_size / (1024*1024):.1f} MB")
                         
                         mode = 'ab' if resume and file_size_exists > 0 else 'wb'
+                        
+                        # A resumed file is only partly seen here, hash it later
+                        hasher = None
+                        if checksum and mode == 'wb':
+                            try:
+                                hasher = hashlib.new(checksum_type)
+                            except ValueError:
+                                pass  # Not a hashlib algorithm, validated on next use
+                        
                         with open(target_path, mode) as f:
                             downloaded = file_size_exists
                             chunk_size = 1024 * 1024  # 1MB chunks
                             
+                            # Report progress in 10% steps instead of every chunk
+                            expected_size = file_size_exists + total_size
+                            step = max(expected_size // 10, 1)
+                            next_report = downloaded + step if total_size > 0 else float("inf")
+                            
                             self.logger.info("Download started, this may take a while...")
                             
                             async for chunk in response.content.iter_chunked(chunk_size):
@@ -183,17 +208,29 @@ class DownloadStage(BuildStage):
                                     break
                                     
                                 f.write(chunk)
+                                if hasher is not None:
+                                    hasher.update(chunk)
                                 downloaded += len(chunk)
                                 
-                                if total_size > 0:
-                                    percent = min(100, downloaded * 100 / (file_size_exists + total_size))
+                                if downloaded >= next_report:
+                                    percent = min(100, downloaded * 100 / expected_size)
                                     self.logger.debug(f"Download progress: {percent:.1f}% ({downloaded / (1024*1024):.1f} MB)")
+                                    next_report += step
                         
                         # Verify file size after download
                         if total_size > 0 and target_path.stat().st_size != file_size_exists + total_size:
                             self.logger.warning(f"Downloaded file size mismatch: expected {total_size + file_size_exists} bytes, got {target_path.stat().st_size} bytes")
                         
                         self.logger.info(f"Download completed: {target_path.stat().st_size / (1024*1024):.1f} MB")
+                        
+                        if hasher is not None:
+                            calc_checksum = hasher.hexdigest()
+                            if calc_checksum != checksum:
+                                self.logger.error(f"Checksum mismatch for {target_path}: expected {checksum}, got {calc_checksum}")
+                                target_path.unlink(missing_ok=True)
+                                return False
+                            self.cache_manager.record_validated(target_path, checksum, checksum_type)
+                        
                         return True
                     else:
                         self.logger.error(f"Download failed with status code: {response.status}")
@@ -297,8 +334,14 @@ class DownloadStage(BuildStage):
                 
             # Extract the file using xz command
             self.logger.info(f"Extracting to {output_path}")
+            # Decompress on all cores; pixz parallelizes any multi-block
+            # stream, xz needs --threads for it
+            if shutil.which("pixz"):
+                cmd = ["pixz", "-d", "-i", str(image_path), "-o", str(output_path)]
+            else:
+                cmd = ["xz", "-d", "-k", "-f", "--threads=0", str(image_path)]
             process = await asyncio.create_subprocess_exec(
-                "xz", "-d", "-k", "-f", str(image_path),
+                *cmd,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE
             )
@@ -314,13 +357,15 @@ class DownloadStage(BuildStage):
                     import lzma
                     with lzma.open(image_path, "rb") as f_in:
                         with open(output_path, "wb") as f_out:
-                            # Copy in chunks to avoid memory issues with large files
-                            chunk_size = 1024 * 1024  # 1MB chunks
+                            # Copy in chunks through one reused 1MB buffer to
+                            # avoid memory issues with large files
+                            buf = bytearray(1024 * 1024)
+                            view = memoryview(buf)
                             while True:
-                                chunk = f_in.read(chunk_size)
-                                if not chunk:
+                                n = f_in.readinto(buf)
+                                if not n:
                                     break
-                                f_out.write(chunk)
+                                f_out.write(view[:n])
                     self.logger.info("Extraction completed with Python lzma")
                 except Exception as e:
                     self.logger.error(f"Python lzma extraction also failed: {str(e)}")
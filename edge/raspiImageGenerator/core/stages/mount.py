@@ -9,6 +9,11 @@ from pathlib import Path
 from typing import Dict, Any
 
 from core.stages.base import BuildStage
+from utils.loop_utils import read_partition_table
+
+# Partition offsets of stock Raspberry Pi OS images, used when the
+# partition table cannot be read
+DEFAULT_PARTITION_OPTIONS = ("loop,offset=4194304", "loop,offset=10485760")
 
 class MountStage(BuildStage):
     """
@@ -79,13 +84,36 @@ class MountStage(BuildStage):
             bool: True if successful, False otherwise.
         """
         try:
-            # Mount boot partition
-            self.logger.info("Mounting boot partition")
-            os.system(f"mount -o loop,offset=4194304 {image_path} {boot_mount}")
+            # Take the partition offsets from the MBR so images with a
+            # non-standard layout mount correctly
+            try:
+                partitions = read_partition_table(image_path)
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Cannot read partition table, using default offsets: {e}")
+                partitions = []
+            
+            if len(partitions) >= 2:
+                options = tuple(f"loop,offset={offset},sizelimit={size}" for offset, size in partitions[:2])
+            else:
+                options = DEFAULT_PARTITION_OPTIONS
             
-            # Mount root filesystem
-            self.logger.info("Mounting root filesystem")
-            os.system(f"mount -o loop,offset=10485760 {image_path} {root_mount}")
+            # Mount boot partition and root filesystem concurrently
+            self.logger.info("Mounting boot partition and root filesystem")
+            image_path_str = str(image_path)
+            processes = await asyncio.gather(*(
+                asyncio.create_subprocess_exec(
+                    "mount", "-o", option, image_path_str, str(mount_point),
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                for option, mount_point in zip(options, (boot_mount, root_mount))
+            ))
+            results = await asyncio.gather(*(process.communicate() for process in processes))
+            
+            for process, (_, stderr) in zip(processes, results):
+                if process.returncode != 0:
+                    self.logger.error(f"Mount failed: {stderr.decode().strip()}")
+                    return False
             
             return True
         except Exception as e:
@@ -106,10 +134,10 @@ class MountStage(BuildStage):
             return False
             
         # Check for essential directories/files
-        if not (boot_mount / "config.txt").exists():
+        if not os.path.exists(os.path.join(boot_mount, "config.txt")):
             return False
             
-        if not (root_mount / "etc").exists() or not (root_mount / "usr").exists():
+        if not os.path.exists(os.path.join(root_mount, "etc")) or not os.path.exists(os.path.join(root_mount, "usr")):
             return False
             
         return True
\ No newline at end of file
@@ -57,7 +57,7 @@ class PublicationStage(BuildStage):
             timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
             
             # Format new filename
-            new_filename = f"{timestamp}_{hive_id}_{version}_image.xz"
+            new_filename = f"{timestamp}_{hive_id}_{version}_image{compressed_image_path.suffix}"
             
             # Get server base path from environment or config
             server_base_path = os.environ.get(
@@ -9,17 +9,25 @@ with proper security configuration from the hive YAML configurations.
 import os
 import sys
 import argparse
-import subprocess
-import tempfile
+import asyncio
 from pathlib import Path
-import yaml
-import inquirer
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from hive_config_manager.core.manager import HiveManager
 from hive_config_manager.utils.security import SecurityUtils
 
 
+# Required security settings as
+# (section, field, label if the section is missing, label if the field is empty)
+REQUIRED_SECURITY_FIELDS = (
+    ('ssh', 'public_key', "SSH configuration", "SSH public key"),
+    ('wireguard', 'private_key', "WireGuard configuration", "WireGuard private key"),
+    ('wireguard', 'config', "WireGuard configuration", "WireGuard configuration"),
+    ('database', 'password', "Database configuration", "Database password"),
+    ('local_access', 'password', "Local access configuration", "Local access password"),
+)
+
+
 class ImageGeneratorCLI:
     """User-friendly interface for generating Raspberry Pi images for hives."""
     
@@ -27,62 +35,50 @@ class ImageGeneratorCLI:
         self.script_dir = Path(__file__).parent.absolute()
         self.generator_script = self.script_dir / "raspi_image_generator.sh"
         self.hive_manager = HiveManager()
+        # Hive list and configurations are read once per CLI run
+        self._hives = None
+        self._hive_configs = {}
     
     def list_hives(self):
         """List all available hives."""
-        return self.hive_manager.list_hives()
+        if self._hives is None:
+            self._hives = self.hive_manager.list_hives()
+        return self._hives
+    
+    def get_hive(self, hive_id: str) -> dict:
+        """Get a hive configuration, reading it from disk only once."""
+        if hive_id not in self._hive_configs:
+            self._hive_configs[hive_id] = self.hive_manager.get_hive(hive_id)
+        return self._hive_configs[hive_id]
     
-    def validate_hive_security(self, hive_id: str) -> tuple:
+    def validate_hive_security(self, config: dict) -> tuple:
         """
         Validate that a hive has all required security configuration.
         
         Args:
-            hive_id: The hive ID to validate
+            config: The hive configuration to validate
             
         Returns:
             (is_valid, missing_items) tuple, where is_valid is a boolean and
             missing_items is a list of missing security items
         """
-        try:
-            config = self.hive_manager.get_hive(hive_id)
-            missing = []
-            
-            # Check security section exists
-            if 'security' not in config:
-                return False, ["security section"]
-            
-            security = config['security']
-            
-            # Check SSH configuration
-            if 'ssh' not in security:
-                missing.append("SSH configuration")
-            elif 'public_key' not in security['ssh'] or not security['ssh']['public_key']:
-                missing.append("SSH public key")
-            
-            # Check WireGuard configuration
-            if 'wireguard' not in security:
-                missing.append("WireGuard configuration")
-            elif 'private_key' not in security['wireguard'] or not security['wireguard']['private_key']:
-                missing.append("WireGuard private key")
-            elif 'config' not in security['wireguard'] or not security['wireguard']['config']:
-                missing.append("WireGuard configuration")
-            
-            # Check database configuration
-            if 'database' not in security:
-                missing.append("Database configuration")
-            elif 'password' not in security['database'] or not security['database']['password']:
-                missing.append("Database password")
-            
-            # Check local access configuration
-            if 'local_access' not in security:
-                missing.append("Local access configuration")
-            elif 'password' not in security['local_access'] or not security['local_access']['password']:
-                missing.append("Local access password")
-            
-            return len(missing) == 0, missing
-            
-        except Exception as e:
-            return False, [str(e)]
+        security = config.get('security')
+        if not security:
+            return False, ["security section"]
+        
+        missing = []
+        for section, field, section_label, field_label in REQUIRED_SECURITY_FIELDS:
+            values = security.get(section)
+            if values is None:
+                label = section_label
+            elif not values.get(field):
+                label = field_label
+            else:
+                continue
+            if label not in missing:
+                missing.append(label)
+        
+        return not missing, missing
     
     def generate_missing_security(self, hive_id: str, server_endpoint: str) -> None:
         """
@@ -100,6 +96,7 @@ class ImageGeneratorCLI:
             
             # Apply the credentials to the hive
             self.hive_manager.apply_security_credentials(hive_id, credentials)
+            self._hive_configs.pop(hive_id, None)
             
             print(f"Generated and applied missing security configuration for {hive_id}")
             return True
@@ -107,12 +104,13 @@ class ImageGeneratorCLI:
             print(f"Error generating security configuration: {str(e)}")
             return False
     
-    def generate_image(self, hive_id: str) -> None:
+    async def generate_image(self, hive_id: str, hives: list = None) -> None:
         """
         Generate a Raspberry Pi image for the specified hive.
         
         Args:
             hive_id: The hive ID to generate an image for
+            hives: Already fetched list of hive IDs, if available
         """
         # Check if the script exists
         if not self.generator_script.exists():
@@ -120,17 +118,28 @@ class ImageGeneratorCLI:
             return False
         
         # Validate that the hive exists
-        if hive_id not in self.list_hives():
+        if hives is None:
+            hives = self.list_hives()
+        if hive_id not in hives:
             print(f"Error: Hive {hive_id} not found")
             return False
         
         # Validate that the hive has all required security configuration
-        valid, missing = self.validate_hive_security(hive_id)
+        try:
+            config = self.get_hive(hive_id)
+        except Exception as e:
+            print(f"Error reading hive {hive_id}: {str(e)}")
+            return False
+        
+        valid, missing = self.validate_hive_security(config)
         if not valid:
             print(f"Hive {hive_id} is missing required security configuration:")
             for item in missing:
                 print(f"  - {item}")
             
+            # Imported lazily: inquirer is slow to load and only needed for prompts
+            import inquirer
+            
             # Ask if we should generate missing security configuration
             generate = inquirer.prompt([
                 inquirer.Confirm('generate',
@@ -156,16 +165,22 @@ class ImageGeneratorCLI:
         # Call the shell script
         print(f"Generating Raspberry Pi image for hive {hive_id}...")
         
-        # Run the script
-        result = subprocess.run([
-            "bash", str(self.generator_script), hive_id
-        ], capture_output=True, text=True)
+        # Run the script, streaming its output as it is produced
+        process = await asyncio.create_subprocess_exec(
+            "bash", str(self.generator_script), hive_id,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
+        )
+        
+        async for line in process.stdout:
+            sys.stdout.buffer.write(line)
+            sys.stdout.buffer.flush()
         
-        if result.returncode != 0:
-            print(f"Error generating image:\n{result.stderr}")
+        returncode = await process.wait()
+        if returncode != 0:
+            print(f"Error generating image: script exited with code {returncode}")
             return False
         else:
-            print(result.stdout)
             print("Image generation successful!")
             return True
 
@@ -193,7 +208,7 @@ def main():
             print("No hives found.")
         
     elif args.generate:
-        cli.generate_image(args.generate)
+        asyncio.run(cli.generate_image(args.generate))
         
     else:
         # Interactive mode
@@ -203,13 +218,14 @@ def main():
             return
         
         # Ask which hive to generate an image for
+        import inquirer
         hive = inquirer.prompt([
             inquirer.List('id',
                 message="Select a hive to generate an image for",
                 choices=hives)
         ])
         
-        cli.generate_image(hive['id'])
+        asyncio.run(cli.generate_image(hive['id'], hives))
             
 
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the W4B Raspberry Pi image cache manager.
+
+These tests validate how cached images are evicted when the cache
+grows beyond its size limit.
+"""
+
+import time
+
+from core.cache_manager import CacheManager
+
+
+class TestEnforceSizeLimit:
+    """Test cases for CacheManager._enforce_size_limit."""
+
+    def _cache_manager(self, tmp_path, max_size_bytes):
+        """Create a cache manager in a temporary directory with a tiny size limit."""
+        return CacheManager(tmp_path / "cache", max_size_gb=max_size_bytes / (1 << 30))
+
+    def _add_download(self, cache_manager, version, access_times, size=10):
+        """Create a cached download with the given access history."""
+        image_info = {"version": version, "url": f"https://example.com/{version}.img.xz"}
+        path = cache_manager.get_download_path(image_info)
+        path.parent.mkdir(parents=True)
+        path.write_bytes(b"\0" * size)
+        cache_manager.save_metadata({**image_info, "access_times": access_times})
+        return path
+
+    def test_lru2_eviction_order(self, tmp_path):
+        """Images used once go first, then by their second most recent use."""
+        # Room for a single 10-byte download
+        cache_manager = self._cache_manager(tmp_path, 15)
+
+        # Created in an order where eviction by mtime or by last use alone
+        # would keep a different image
+        now = time.time()
+        reused_recently = self._add_download(cache_manager, "recent", [now - 2500, now - 100])
+        used_once = self._add_download(cache_manager, "once", [now])
+        reused_long_ago = self._add_download(cache_manager, "old", [now - 3000, now - 2000])
+
+        cache_manager._enforce_size_limit()
+
+        assert not used_once.exists()
+        assert not reused_long_ago.exists()
+        assert reused_recently.exists()
+
+    def test_no_eviction_below_limit(self, tmp_path):
+        """Nothing is removed while the cache fits its size limit."""
+        cache_manager = self._cache_manager(tmp_path, 100)
+        path = self._add_download(cache_manager, "once", [time.time()])
+
+        cache_manager._enforce_size_limit()
+
+        assert path.exists()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the W4B Raspberry Pi Image Generator configuration.
+
+These tests validate the helpers that convert and combine configuration
+values from environment variables, YAML files and defaults.
+"""
+
+from types import MappingProxyType
+
+import pytest
+
+from core.config import ConfigManager, _coerce_env_value, _copy_template, _freeze
+
+
+class TestCoerceEnvValue:
+    """Test cases for _coerce_env_value."""
+
+    @pytest.mark.parametrize("value", ["true", "TRUE", "yes", "on", "On", "1"])
+    def test_true_words(self, value):
+        """Boolean words are matched case-insensitively; "1" is a bool, not an int."""
+        assert _coerce_env_value(value) is True
+
+    @pytest.mark.parametrize("value", ["false", "False", "no", "off", "OFF", "0"])
+    def test_false_words(self, value):
+        """Negative boolean words become False."""
+        assert _coerce_env_value(value) is False
+
+    @pytest.mark.parametrize("value, expected", [("42", 42), ("-7", -7), ("1024000", 1024000)])
+    def test_integers(self, value, expected):
+        """Decimal numbers, including negative ones, become ints."""
+        assert _coerce_env_value(value) == expected
+        assert type(_coerce_env_value(value)) is int
+
+    @pytest.mark.parametrize("value", ["-", "--1", "1.5", "0x10", "truthy", "Europe/Berlin", ""])
+    def test_other_values_are_unchanged(self, value):
+        """Anything else is passed through as the original string."""
+        assert _coerce_env_value(value) == value
+
+
+class TestMergeConfig:
+    """Test cases for ConfigManager._merge_config."""
+
+    @pytest.fixture
+    def manager(self):
+        """Create a config manager without loading any configuration."""
+        return ConfigManager.__new__(ConfigManager)
+
+    def test_flat_merge(self, manager):
+        """Source values replace and extend target values."""
+        target = {"a": 1, "b": 2}
+        manager._merge_config(target, {"b": 3, "c": 4})
+
+        assert target == {"a": 1, "b": 3, "c": 4}
+
+    def test_nested_dicts_are_merged(self, manager):
+        """Dicts on both sides are merged key by key at every depth."""
+        target = {"system": {"timezone": "UTC", "locale": {"lang": "en", "keymap": "us"}}, "keep": True}
+        manager._merge_config(target, {"system": {"locale": {"keymap": "de"}, "hostname": "hive"}})
+
+        assert target == {
+            "system": {"timezone": "UTC", "locale": {"lang": "en", "keymap": "de"}, "hostname": "hive"},
+            "keep": True,
+        }
+
+    def test_non_dict_values_replace(self, manager):
+        """A dict replaces a scalar and a scalar replaces a dict."""
+        target = {"a": 1, "b": {"x": 1}}
+        manager._merge_config(target, {"a": {"y": 2}, "b": None})
+
+        assert target == {"a": {"y": 2}, "b": None}
+
+    def test_source_is_not_modified(self, manager):
+        """Merging must not write into the source configuration."""
+        source = {"system": {"locale": {"keymap": "de"}}}
+        manager._merge_config({"system": {"locale": {"lang": "en"}}}, source)
+
+        assert source == {"system": {"locale": {"keymap": "de"}}}
+
+
+class TestConfigTemplate:
+    """Test cases for _freeze and _copy_template."""
+
+    @pytest.fixture
+    def template(self):
+        """Freeze a small nested configuration."""
+        return _freeze({"system": {"locale": {"lang": "en"}, "packages": ["vim", "git"]}, "debug": False})
+
+    def test_freeze_is_read_only(self, template):
+        """Nested dicts become read-only views and lists become tuples."""
+        assert isinstance(template, MappingProxyType)
+        assert isinstance(template["system"]["locale"], MappingProxyType)
+        assert template["system"]["packages"] == ("vim", "git")
+
+        with pytest.raises(TypeError):
+            template["system"]["locale"]["lang"] = "de"
+
+    def test_copy_is_mutable_and_independent(self, template):
+        """Copies are plain dicts whose changes never reach the template."""
+        config = _copy_template(template)
+        assert type(config) is dict
+        assert type(config["system"]["locale"]) is dict
+
+        config["system"]["locale"]["lang"] = "de"
+        config["debug"] = True
+
+        assert template["system"]["locale"]["lang"] == "en"
+        assert template["debug"] is False
+        assert _copy_template(template)["system"]["locale"] == {"lang": "en"}
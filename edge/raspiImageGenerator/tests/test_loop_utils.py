@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the loop device utilities.
+
+These tests validate the MBR partition table parser used to locate the
+boot and root partitions of a disk image, and the wait for device nodes.
+"""
+
+import asyncio
+import struct
+
+import pytest
+
+from utils.loop_utils import MBR_PARTITION_TABLE_OFFSET, SECTOR_SIZE, read_partition_table, wait_for_device_nodes
+
+
+def _write_mbr(path, entries, signature=b"\x55\xAA"):
+    """Write a single-sector image with the given (type, first_lba, sectors) entries."""
+    mbr = bytearray(SECTOR_SIZE)
+    for index, (part_type, first_lba, num_sectors) in enumerate(entries):
+        entry = MBR_PARTITION_TABLE_OFFSET + index * 16
+        mbr[entry + 4] = part_type
+        struct.pack_into("<II", mbr, entry + 8, first_lba, num_sectors)
+    mbr[510:512] = signature
+    path.write_bytes(bytes(mbr))
+    return path
+
+
+class TestReadPartitionTable:
+    """Test cases for read_partition_table."""
+
+    def test_two_partitions(self, tmp_path):
+        """Boot and root partitions are returned as byte offsets and sizes."""
+        image = _write_mbr(tmp_path / "pi.img", [(0x0C, 8192, 524288), (0x83, 532480, 4194304)])
+
+        assert read_partition_table(image) == [
+            (8192 * SECTOR_SIZE, 524288 * SECTOR_SIZE),
+            (532480 * SECTOR_SIZE, 4194304 * SECTOR_SIZE),
+        ]
+
+    def test_unused_entries_are_skipped(self, tmp_path):
+        """Entries without a type or without sectors are not partitions."""
+        image = _write_mbr(tmp_path / "pi.img", [(0x0C, 8192, 2048), (0x00, 0, 0), (0x83, 10240, 0)])
+
+        assert read_partition_table(image) == [(8192 * SECTOR_SIZE, 2048 * SECTOR_SIZE)]
+
+    def test_gpt_protective_entry_is_rejected(self, tmp_path):
+        """Images with a GPT partition table are refused."""
+        image = _write_mbr(tmp_path / "gpt.img", [(0xEE, 1, 0xFFFFFFFF)])
+
+        with pytest.raises(ValueError, match="GPT"):
+            read_partition_table(image)
+
+    def test_bad_signature_is_rejected(self, tmp_path):
+        """A sector without the 0x55AA boot signature is not an MBR."""
+        image = _write_mbr(tmp_path / "raw.img", [(0x0C, 8192, 2048)], signature=b"\x00\x00")
+
+        with pytest.raises(ValueError, match="No valid MBR"):
+            read_partition_table(image)
+
+    def test_short_file_is_rejected(self, tmp_path):
+        """Files smaller than one sector cannot hold an MBR."""
+        image = tmp_path / "short.img"
+        image.write_bytes(b"\x55\xAA")
+
+        with pytest.raises(ValueError, match="No valid MBR"):
+            read_partition_table(image)
+
+
+class TestWaitForDeviceNodes:
+    """Test cases for wait_for_device_nodes."""
+
+    def test_existing_group_returns_immediately(self, tmp_path):
+        """Any one complete group of paths is enough."""
+        (tmp_path / "loop0p1").touch()
+        (tmp_path / "loop0p2").touch()
+        candidates = [(str(tmp_path / "missing"),), (str(tmp_path / "loop0p1"), str(tmp_path / "loop0p2"))]
+
+        assert asyncio.run(wait_for_device_nodes(candidates, timeout=0.1)) is True
+
+    def test_node_created_while_waiting(self, tmp_path):
+        """Nodes that appear during the wait are picked up."""
+        node = tmp_path / "loop0p2"
+
+        async def create_later():
+            asyncio.get_running_loop().call_later(0.05, node.touch)
+            return await wait_for_device_nodes([(str(node),)], timeout=2.0)
+
+        assert asyncio.run(create_later()) is True
+
+    def test_timeout(self, tmp_path):
+        """Incomplete groups time out."""
+        (tmp_path / "loop0p1").touch()
+        candidates = [(str(tmp_path / "loop0p1"), str(tmp_path / "loop0p2"))]
+
+        assert asyncio.run(wait_for_device_nodes(candidates, timeout=0.05)) is False
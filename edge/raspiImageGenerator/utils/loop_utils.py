@@ -9,11 +9,144 @@ It can be used both programmatically and as a command-line utility.
 import os
 import sys
 import argparse
+import asyncio
+import errno
+import fcntl
+import struct
 import subprocess
 import time
 from pathlib import Path
 import glob
 import json
+from typing import List, Sequence, Tuple, Union
+
+# MBR layout used to locate the partitions of a disk image
+SECTOR_SIZE = 512
+MBR_PARTITION_TABLE_OFFSET = 0x1BE
+GPT_PROTECTIVE_TYPE = 0xEE
+
+# Loop device ioctls from <linux/loop.h>
+LOOP_SET_FD = 0x4C00
+LOOP_CLR_FD = 0x4C01
+LOOP_SET_STATUS64 = 0x4C04
+LOOP_CTL_GET_FREE = 0x4C82
+LO_FLAGS_PARTSCAN = 8
+# struct loop_info64
+LOOP_INFO64_FORMAT = "QQQQQIIII64s64s32sQQ"
+
+
+def read_partition_table(image_path: Union[str, Path]) -> List[Tuple[int, int]]:
+    """
+    Read the primary partitions from the MBR of a disk image.
+    
+    Args:
+        image_path: Path to the disk image
+        
+    Returns:
+        List[Tuple[int, int]]: (offset, size) in bytes of each used partition
+        
+    Raises:
+        ValueError: If the image has no valid MBR, or uses GPT
+    """
+    with open(image_path, "rb") as f:
+        mbr = f.read(SECTOR_SIZE)
+    
+    if len(mbr) < SECTOR_SIZE or mbr[510:512] != b'\x55\xAA':
+        raise ValueError(f"No valid MBR found in {image_path}")
+    
+    partitions = []
+    for index in range(4):
+        entry = MBR_PARTITION_TABLE_OFFSET + index * 16
+        part_type = mbr[entry + 4]
+        if part_type == GPT_PROTECTIVE_TYPE:
+            raise ValueError(f"{image_path} uses a GPT partition table")
+        first_lba, num_sectors = struct.unpack_from("<II", mbr, entry + 8)
+        if part_type and num_sectors:
+            partitions.append((first_lba * SECTOR_SIZE, num_sectors * SECTOR_SIZE))
+    
+    return partitions
+
+
+def attach_loop_device(image_path: Union[str, Path], partscan: bool = True) -> str:
+    """
+    Attach an image to a free loop device through /dev/loop-control.
+    
+    Does what `losetup -f -P` does with a few ioctls in this process.
+    
+    Args:
+        image_path: Path to the image file
+        partscan: Whether the kernel should scan the image for partitions
+        
+    Returns:
+        str: Path of the loop device
+        
+    Raises:
+        OSError: If no loop device could be set up
+    """
+    control_fd = os.open("/dev/loop-control", os.O_RDWR)
+    try:
+        image_fd = os.open(image_path, os.O_RDWR)
+        try:
+            # Another process may claim the free device first, then try the next
+            for _ in range(3):
+                loop_device = f"/dev/loop{fcntl.ioctl(control_fd, LOOP_CTL_GET_FREE)}"
+                loop_fd = os.open(loop_device, os.O_RDWR)
+                try:
+                    try:
+                        fcntl.ioctl(loop_fd, LOOP_SET_FD, image_fd)
+                    except OSError as e:
+                        if e.errno == errno.EBUSY:
+                            continue
+                        raise
+                    
+                    info = struct.pack(
+                        LOOP_INFO64_FORMAT, 0, 0, 0, 0, 0, 0, 0, 0,
+                        LO_FLAGS_PARTSCAN if partscan else 0,
+                        os.fsencode(str(image_path))[:63], b"", b"", 0, 0
+                    )
+                    try:
+                        fcntl.ioctl(loop_fd, LOOP_SET_STATUS64, info)
+                    except OSError:
+                        fcntl.ioctl(loop_fd, LOOP_CLR_FD, 0)
+                        raise
+                    return loop_device
+                finally:
+                    os.close(loop_fd)
+        finally:
+            os.close(image_fd)
+    finally:
+        os.close(control_fd)
+    
+    raise OSError(errno.EBUSY, "No free loop device")
+
+
+async def wait_for_device_nodes(candidates: Sequence[Sequence[str]], timeout: float) -> bool:
+    """
+    Wait until all paths of one candidate group exist.
+    
+    Polls with a short, growing interval, so device nodes that udev
+    creates within milliseconds are picked up right away.
+    
+    Args:
+        candidates: Groups of paths, e.g. the partition nodes of each naming scheme
+        timeout: Maximum time to wait in seconds
+        
+    Returns:
+        bool: True if a group appeared, False if the timeout expired
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    interval = 0.01
+    
+    while not any(all(os.path.exists(path) for path in paths) for paths in candidates):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 2, 0.5)
+    
+    return True
+
 
 def setup_loop_device(image_path: str, force_partition: bool = True) -> dict:
     """
@@ -1,85 +1,215 @@
 import os
+import sys
+import json
 import time
-import subprocess
+import fcntl
+import asyncio
+import argparse
 import curses
 from datetime import datetime, timedelta
 
 WG_DIR = "/etc/wireguard"
 PEER_MAP = os.path.join(WG_DIR, "peer_mapping.txt")
+ROW_FMT = "{:<20} | {:<20} | {:<20} | {:<20} | {:<20} | {:<20} | {:<20}"
+REFRESH_INTERVAL = 5
+
+# Status published by `wgmonitor.py --daemon` and shared by all monitor sessions
+STATE_DIR = "/run/wgmonitor"
+STATE_FILE = os.path.join(STATE_DIR, "state.json")
+LOCK_FILE = os.path.join(STATE_DIR, "daemon.lock")
+
+# (mtime, mapping) of the last parsed peer mapping file
+_peer_mapping_cache = (None, {})
 
 def get_peer_mapping():
-    peer_mapping = {}
-    if os.path.exists(PEER_MAP):
-        with open(PEER_MAP, 'r') as f:
-            for line in f:
-                public_key, client_name = line.strip().split()
-                peer_mapping[public_key] = client_name
+    global _peer_mapping_cache
+    try:
+        mtime = os.stat(PEER_MAP).st_mtime
+    except OSError:
+        return {}
+    cached_mtime, cached_mapping = _peer_mapping_cache
+    if mtime == cached_mtime:
+        return cached_mapping
+    with open(PEER_MAP, 'r') as f:
+        text = f.read()
+    peer_mapping = {
+        public_key: client_name
+        for line in text.splitlines() if line.strip()
+        for public_key, client_name in [line.strip().split(None, 1)]
+    }
+    _peer_mapping_cache = (mtime, peer_mapping)
     return peer_mapping
 
-def get_wireguard_status():
-    result = subprocess.run(['wg', 'show'], capture_output=True, text=True)
-    return result.stdout
+async def get_wireguard_status():
+    # Machine-readable, tab-separated output with handshakes as epoch seconds
+    proc = await asyncio.create_subprocess_exec(
+        'wg', 'show', 'all', 'dump',
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await proc.communicate()
+    return stdout.decode()
+
+def write_shared_state(peers):
+    # Write to a private temp file and rename so readers never see a partial file
+    tmp_path = STATE_FILE + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'timestamp': time.time(), 'peers': peers}, f)
+    os.replace(tmp_path, STATE_FILE)
+
+def read_shared_state(max_age):
+    try:
+        with open(STATE_FILE, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - state.get('timestamp', 0) > max_age:
+        return None
+    return state.get('peers')
+
+async def fetch_peers(refresh_interval):
+    # Prefer the daemon's shared poll; query wg directly if it is not running
+    peers = read_shared_state(2 * refresh_interval)
+    if peers is None:
+        peers = parse_wireguard_status(await get_wireguard_status(), get_peer_mapping())
+    return peers
+
+async def run_daemon(refresh_interval):
+    # Only the parsed peer fields are published, never the keys in the dump
+    while True:
+        status = await get_wireguard_status()
+        write_shared_state(parse_wireguard_status(status, get_peer_mapping()))
+        await asyncio.sleep(refresh_interval)
+
+def daemon_main(refresh_interval=REFRESH_INTERVAL):
+    if os.geteuid() != 0:
+        print("This script must be run as root. Please use sudo.")
+        return
+    
+    os.makedirs(STATE_DIR, mode=0o700, exist_ok=True)
+    os.chmod(STATE_DIR, 0o700)
+    with open(LOCK_FILE, 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print("Another wgmonitor daemon is already running.")
+            return
+        try:
+            asyncio.run(run_daemon(refresh_interval))
+        except KeyboardInterrupt:
+            pass
+
+def format_bytes(num_bytes):
+    size = float(num_bytes)
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return f"{size:.2f} {unit}"
+        size /= 1024
+    return f"{size:.2f} TiB"
 
 def parse_wireguard_status(status, peer_mapping):
+    now = int(time.time())
     peers = []
-    current_peer = None
-    for line in status.splitlines():
-        if line.startswith('peer:'):
-            if current_peer:
-                peers.append(current_peer)
-            current_peer = {'public_key': line.split()[1]}
-        elif line.startswith('  endpoint:'):
-            current_peer['endpoint'] = line.split()[1]
-        elif line.startswith('  allowed ips:'):
-            current_peer['allowed_ips'] = line.split()[2]
-        elif line.startswith('  latest handshake:'):
-            handshake_time = ' '.join(line.split()[2:])
-            current_peer['latest_handshake'] = handshake_time
-            try:
-                current_peer['connected_since'] = datetime.strptime(handshake_time, '%Y-%m-%d %H:%M:%S')
-            except ValueError:
-                current_peer['connected_since'] = 'N/A'
-        elif line.startswith('  transfer:'):
-            current_peer['transfer'] = line.split()[1] + ' ' + line.split()[2]
-    if current_peer:
-        peers.append(current_peer)
-    
-    for peer in peers:
-        peer['name'] = peer_mapping.get(peer['public_key'], 'Unknown')
-        if isinstance(peer.get('connected_since'), datetime):
-            peer['connection_duration'] = str(datetime.now() - peer['connected_since']).split('.')[0]
-            peer['connected_since'] = peer['connected_since'].strftime('%Y-%m-%d %H:%M:%S')
+    for line in status.split('\n'):
+        parts = line.split('\t')
+        # Interface lines have 5 fields, peer lines have 9
+        if len(parts) != 9:
+            continue
+        # Key columns (public and preshared) are never copied out
+        _, public_key, _, endpoint, allowed_ips, handshake, rx, tx, _ = parts
+        handshake = int(handshake)
+        if handshake:
+            connected_since = datetime.fromtimestamp(handshake).strftime('%Y-%m-%d %H:%M:%S')
+            connection_duration = str(timedelta(seconds=max(now - handshake, 0)))
         else:
-            peer['connection_duration'] = 'N/A'
-            peer['connected_since'] = 'N/A'
-    
+            connected_since = connection_duration = 'N/A'
+        peers.append({
+            'name': peer_mapping.get(public_key, 'Unknown'),
+            'endpoint': endpoint,
+            'allowed_ips': allowed_ips,
+            'latest_handshake': handshake or None,
+            'transfer': f"{format_bytes(rx)} / {format_bytes(tx)}",
+            'connected_since': connected_since,
+            'connection_duration': connection_duration,
+        })
     return peers
 
-def format_time_ago(time_str):
-    try:
-        time_ago = datetime.strptime(time_str, '%Y-%m-%d %H:%M:%S')
-        delta = datetime.now() - time_ago
-        total_seconds = int(delta.total_seconds())
-        hours, remainder = divmod(total_seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        return f"{hours:02}:{minutes:02}:{seconds:02} ago"
-    except ValueError:
-        return time_str
+def format_time_ago(epoch, now=None):
+    if not epoch:
+        return 'N/A'
+    if now is None:
+        now = int(time.time())
+    hours, remainder = divmod(max(now - epoch, 0), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02} ago"
 
 def display_status(stdscr, peers, last_refresh, next_refresh):
-    stdscr.clear()
-    stdscr.addstr(0, 0, "WireGuard Status Monitor", curses.A_BOLD)
+    # Overwrite in place instead of clear() so curses only sends changed cells
+    stdscr.attron(curses.A_BOLD)
+    stdscr.addstr(0, 0, "WireGuard Status Monitor")
+    stdscr.attroff(curses.A_BOLD)
     stdscr.addstr(1, 0, "========================")
     stdscr.addstr(2, 0, f"Last Refresh: {last_refresh} | Next Refresh: {next_refresh} | Press 'r' to refresh, 'q' to quit")
+    stdscr.clrtoeol()
     stdscr.addstr(3, 0, "-" * 120)
-    stdscr.addstr(4, 0, f"{'Name':<20} | {'Endpoint':<20} | {'Allowed IPs':<20} | {'Latest Handshake':<20} | {'Transfer':<20} | {'Connected Since':<20} | {'Connection Duration':<20}")
+    stdscr.addstr(4, 0, ROW_FMT.format('Name', 'Endpoint', 'Allowed IPs', 'Latest Handshake', 'Transfer', 'Connected Since', 'Connection Duration'))
     stdscr.addstr(5, 0, "-" * 120)
     
+    now = int(time.time())
+    addstr = stdscr.addstr
+    clrtoeol = stdscr.clrtoeol
+    row_format = ROW_FMT.format
     for idx, peer in enumerate(peers, start=6):
-        latest_handshake = format_time_ago(peer['latest_handshake'])
-        stdscr.addstr(idx, 0, f"{peer['name']:<20} | {peer['endpoint']:<20} | {peer['allowed_ips']:<20} | {latest_handshake:<20} | {peer['transfer']:<20} | {peer['connected_since']:<20} | {peer['connection_duration']:<20}")
+        latest_handshake = format_time_ago(peer['latest_handshake'], now)
+        addstr(idx, 0, row_format(peer['name'], peer['endpoint'], peer['allowed_ips'], latest_handshake, peer['transfer'], peer['connected_since'], peer['connection_duration']))
+        clrtoeol()
+    
+    # Wipe rows left over from a previous, longer peer list
+    stdscr.move(6 + len(peers), 0)
+    stdscr.clrtobot()
+    stdscr.noutrefresh()
+    curses.doupdate()
+
+async def monitor(stdscr, refresh_interval=REFRESH_INTERVAL):
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    quit_requested = False
     
-    stdscr.refresh()
+    # Keys are handled as they arrive, even while `wg` is still running
+    def on_key():
+        nonlocal quit_requested
+        while True:
+            key = stdscr.getch()
+            if key == -1:
+                break
+            if key == ord('q'):
+                quit_requested = True
+                wake.set()
+            elif key == ord('r'):
+                wake.set()
+    
+    stdscr.nodelay(True)
+    stdin_fd = sys.stdin.fileno()
+    loop.add_reader(stdin_fd, on_key)
+    try:
+        while not quit_requested:
+            wake.clear()
+            last_refresh = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            next_refresh = (datetime.now() + timedelta(seconds=refresh_interval)).strftime('%Y-%m-%d %H:%M:%S')
+            
+            peers = await fetch_peers(refresh_interval)
+            if quit_requested:
+                break
+            display_status(stdscr, peers, last_refresh, next_refresh)
+            
+            # Sleep until the next refresh unless 'r' or 'q' is pressed
+            try:
+                await asyncio.wait_for(wake.wait(), refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        loop.remove_reader(stdin_fd)
 
 def main(stdscr):
     if os.geteuid() != 0:
@@ -87,24 +217,19 @@ def main(stdscr):
         return
     
     curses.curs_set(0)
-    peer_mapping = get_peer_mapping()
-    refresh_interval = 5
-    
-    while True:
-        last_refresh = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        next_refresh = (datetime.now() + timedelta(seconds=refresh_interval)).strftime('%Y-%m-%d %H:%M:%S')
-        
-        status = get_wireguard_status()
-        peers = parse_wireguard_status(status, peer_mapping)
-        display_status(stdscr, peers, last_refresh, next_refresh)
-        
-        for _ in range(refresh_interval * 10):
-            key = stdscr.getch()
-            if key == ord('q'):
-                return
-            elif key == ord('r'):
-                break
-            time.sleep(0.1)
+    # Let curses use line insert/delete and skip newline translation on output
+    curses.nonl()
+    stdscr.idlok(True)
+    stdscr.scrollok(False)
+    asyncio.run(monitor(stdscr))
 
 if __name__ == "__main__":
-    curses.wrapper(main)
+    parser = argparse.ArgumentParser(description="WireGuard status monitor")
+    parser.add_argument('--daemon', action='store_true',
+                        help=f"poll wg in the background and publish the status to {STATE_FILE} for all monitor sessions")
+    args = parser.parse_args()
+    
+    if args.daemon:
+        daemon_main()
+    else:
+        curses.wrapper(main)